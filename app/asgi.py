@@ -17,8 +17,12 @@ django.setup()
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
+from app import tracing
 from game.routing import websocket_urlpatterns
 
+if tracing.PROFILE_SIGNAL:
+    tracing.install_profile_signal()
+
 # application = get_asgi_application()
 
 application = ProtocolTypeRouter(
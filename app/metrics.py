@@ -0,0 +1,157 @@
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Latency buckets in seconds, from a cached read to a slow database write
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+update_task_seconds = Histogram(
+    "bingo_update_task_seconds",
+    "Time to complete a task received over a websocket",
+    buckets=LATENCY_BUCKETS,
+)
+group_send_seconds = Histogram(
+    "bingo_group_send_seconds",
+    "Time to publish an event to a game group",
+    ["event"],
+    buckets=LATENCY_BUCKETS,
+)
+replay_seconds = Histogram(
+    "bingo_replay_seconds",
+    "Time to catch a connecting player up on missed updates",
+    buckets=LATENCY_BUCKETS,
+)
+replay_entries = Histogram(
+    "bingo_replay_entries",
+    "Offline stream entries sent to a reconnecting player",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 200, 500),
+)
+http_request_seconds = Histogram(
+    "bingo_http_request_seconds",
+    "REST request latency by view",
+    ["view", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+websocket_connections = Gauge(
+    "bingo_websocket_connections",
+    "Open websocket connections per game",
+    ["game"],
+    multiprocess_mode="livesum",
+)
+offline_queue_length = Gauge(
+    "bingo_offline_queue_length",
+    "Entries in a game's offline stream as of its last update",
+    ["game"],
+    multiprocess_mode="livemax",
+)
+
+# Open connections per game in this process, so a game's series are removed
+# once its last connection closes rather than accumulating for every game
+open_connections = {}
+
+
+def connection_opened(game_id):
+    open_connections[game_id] = open_connections.get(game_id, 0) + 1
+    websocket_connections.labels(game_id).inc()
+
+
+def connection_closed(game_id):
+    open_connections[game_id] = open_connections.get(game_id, 0) - 1
+    if open_connections[game_id] > 0:
+        websocket_connections.labels(game_id).dec()
+        return
+    del open_connections[game_id]
+    websocket_connections.labels(game_id).dec()
+    offline_queue_length.labels(game_id).set(0)
+    # Worker processes report through files that remove() leaves untouched, so
+    # there the zeroed values are what the other processes' scrapes see
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    for gauge in (websocket_connections, offline_queue_length):
+        gauge.remove(game_id)
+
+
+class DatabasePoolCollector:
+    """Reports connection pool usage of each pooled database when scraped"""
+
+    def describe(self):
+        # Registering would otherwise collect, creating pools before the
+        # database settings are final, e.g. before the test database exists
+        return self.families()
+
+    def families(self):
+        return (
+            GaugeMetricFamily(
+                "bingo_db_pool_connections",
+                "Connections held by the pool",
+                labels=["db"],
+            ),
+            GaugeMetricFamily(
+                "bingo_db_pool_available", "Idle connections in the pool", labels=["db"]
+            ),
+            GaugeMetricFamily(
+                "bingo_db_pool_waiting",
+                "Requests waiting for a pool connection",
+                labels=["db"],
+            ),
+        )
+
+    def collect(self):
+        size, available, waiting = self.families()
+        for alias in connections:
+            if not connections.settings[alias].get("OPTIONS", {}).get("pool"):
+                continue
+            stats = connections[alias].pool.get_stats()
+            size.add_metric([alias], stats.get("pool_size", 0))
+            available.add_metric([alias], stats.get("pool_available", 0))
+            waiting.add_metric([alias], stats.get("requests_waiting", 0))
+        yield from (size, available, waiting)
+
+
+REGISTRY.register(DatabasePoolCollector())
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process, or of every worker process
+    when PROMETHEUS_MULTIPROC_DIR is set"""
+    if settings.METRICS_TOKEN and (
+        request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponse(status=401)
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(DatabasePoolCollector())
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """Records the latency of every request by the name of the view it resolved to"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        http_request_seconds.labels(
+            match.url_name or match.view_name if match else "unmatched",
+            request.method,
+            response.status_code,
+        ).observe(time.perf_counter() - start)
+        return response
@@ -0,0 +1,85 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PIN_COOKIE = "primary_pin"
+
+# Set once the current request or task writes, so its later reads see the write
+primary_pinned = ContextVar("primary_pinned", default=False)
+wrote = ContextVar("wrote", default=False)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica")]
+
+
+@contextmanager
+def pin_primary():
+    """Read from the primary inside the block, e.g. to seed a cache"""
+    token = primary_pinned.set(True)
+    try:
+        yield
+    finally:
+        primary_pinned.reset(token)
+
+
+class ReplicaRouter:
+    """Sends game reads to a random replica and all writes to the primary.
+
+    Reads outside the game app, reads inside a transaction on the primary and
+    any read after a write in the same request stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        aliases = replicas()
+        if (
+            model._meta.app_label != "game"
+            or not aliases
+            or primary_pinned.get()
+            or connections["default"].in_atomic_block
+        ):
+            return "default"
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        primary_pinned.set(True)
+        wrote.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaPinningMiddleware:
+    """Keeps a client on the primary for REPLICA_PIN_SECONDS after it writes.
+
+    Replicas lag the primary, so a client that publishes a game and joins it
+    straight away would otherwise risk not finding it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_token = primary_pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote_token = wrote.set(False)
+        try:
+            response = self.get_response(request)
+            pin = wrote.get()
+        finally:
+            primary_pinned.reset(pinned_token)
+            wrote.reset(wrote_token)
+        if pin and replicas():
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True
+            )
+        return response
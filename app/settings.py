@@ -18,6 +18,8 @@ import sentry_sdk
 from dotenv import load_dotenv
 from sentry_sdk.integrations.django import DjangoIntegration
 
+from app.tracing import sampler
+
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
 load_dotenv(dotenv_path)
 
@@ -55,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "app.metrics.MetricsMiddleware",
+    "app.tracing.TracingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -63,6 +67,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "app.routers.ReplicaPinningMiddleware",
 ]
 
 ROOT_URLCONF = "app.urls"
@@ -86,23 +91,64 @@ TEMPLATES = [
 WSGI_APPLICATION = "app.wsgi.application"
 ASGI_APPLICATION = "app.asgi.application"
 
+# Comma separated Redis nodes that game groups and offline queues are sharded across
+REDIS_URLS = os.getenv("REDIS_URLS", os.getenv("REDIS_URL", "")).split(",")
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [{"address": os.getenv("REDIS_URL")}]},
+        "BACKEND": "game.sharding.ShardedRedisChannelLayer",
+        "CONFIG": {"hosts": [{"address": url} for url in REDIS_URLS]},
     },
 }
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    "default": dj_database_url.config(
-        default=os.getenv("DATABASE_URL"), conn_max_age=600, ssl_require=True
-    )
+# Connections come from a bounded psycopg pool per database instead of being
+# held open by every sync view and database_sync_to_async thread
+DB_POOL = os.getenv("DB_POOL", "true") == "true"
+DB_POOL_OPTIONS = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+    # Seconds a thread waits for a free connection before erroring
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", 300)),
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", 1800)),
 }
 
 
+def database(url):
+    if not url:
+        return {}
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=0 if DB_POOL else 600,
+        conn_health_checks=True,
+        ssl_require=True,
+    )
+    if DB_POOL:
+        config["OPTIONS"]["pool"] = dict(DB_POOL_OPTIONS)
+    return config
+
+
+DATABASES = {"default": database(os.getenv("DATABASE_URL"))}
+
+# Optional comma separated read replicas that game reads are spread across
+for index, url in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(","))
+):
+    DATABASES[f"replica{index}"] = database(url)
+    DATABASES[f"replica{index}"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["app.routers.ReplicaRouter"]
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+
+# Bearer token required to scrape /metrics/, open when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -149,7 +195,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 sentry_sdk.init(
     dsn=os.getenv("SENTRY_DNS"),
     integrations=[DjangoIntegration()],
-    traces_sample_rate=1.0,
+    traces_sampler=sampler,
     send_default_pii=True,
 )
 
@@ -177,5 +223,15 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "app": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+        "feedback": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
@@ -0,0 +1,192 @@
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+import sentry_sdk
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger("app")
+
+# Share of requests and websocket messages traced, with per-name overrides as
+# comma separated url names or websocket transaction names, e.g.
+# "game_leaderboard=0.5,websocket.complete_task=0.01"
+TRACES_SAMPLE_RATE = float(os.getenv("TRACES_SAMPLE_RATE", 0.05))
+TRACES_SAMPLE_RATES = os.getenv("TRACES_SAMPLE_RATES", "")
+# A request this slow, or failing, has every trace of its name sampled for a while
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", 500))
+TRACE_BOOST_SECONDS = int(os.getenv("TRACE_BOOST_SECONDS", 60))
+
+# Sending SIGUSR2 samples the event loop thread's stacks for PROFILE_SECONDS
+# and logs the hottest ones
+PROFILE_SIGNAL = os.getenv("PROFILE_SIGNAL", "false").lower() == "true"
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", 10))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
+
+def parse_rates(rates):
+    return {
+        name.strip(): float(rate)
+        for name, _, rate in (item.partition("=") for item in rates.split(","))
+        if name.strip()
+    }
+
+
+class TraceSampler:
+    """Sentry traces_sampler with a rate per transaction name.
+
+    Transactions are named by url name for REST views and by the names given
+    to traced() for websocket handlers. Whether a request is slow or fails is
+    only known once it has finished, so instead of that request every
+    transaction with its name is sampled for boost_seconds afterwards.
+    """
+
+    def __init__(self, rate, rates=None, slow_ms=500, boost_seconds=60):
+        self.default_rate = rate
+        self.rates = rates or {}
+        self.slow = slow_ms / 1000
+        self.boost_seconds = boost_seconds
+        self.boosted = {}
+
+    def __call__(self, sampling_context):
+        if sampling_context.get("parent_sampled") is not None:
+            return sampling_context["parent_sampled"]
+        return self.rate(self.name(sampling_context))
+
+    def rate(self, name):
+        if self.boosted.get(name, 0) > time.monotonic():
+            return 1.0
+        return self.rates.get(name, self.default_rate)
+
+    def name(self, sampling_context):
+        scope = sampling_context.get("asgi_scope") or {}
+        environ = sampling_context.get("wsgi_environ") or {}
+        path = scope.get("path") if scope.get("type") == "http" else None
+        path = path or environ.get("PATH_INFO")
+        if path is None:
+            return sampling_context["transaction_context"]["name"]
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return "unmatched"
+        return match.url_name or match.view_name
+
+    def record(self, name, seconds, failed=False):
+        if not failed and seconds < self.slow:
+            return
+        if self.boosted.get(name, 0) <= time.monotonic():
+            logger.info(
+                f"TraceSampler.record(), Name: {name}, Seconds: {seconds:.3f}, "
+                f"Failed: {failed}, sampling all for {self.boost_seconds}s"
+            )
+        self.boosted[name] = time.monotonic() + self.boost_seconds
+
+
+sampler = TraceSampler(
+    TRACES_SAMPLE_RATE,
+    parse_rates(TRACES_SAMPLE_RATES),
+    slow_ms=TRACE_SLOW_MS,
+    boost_seconds=TRACE_BOOST_SECONDS,
+)
+
+
+def traced(name):
+    """Runs the decorated coroutine, e.g. a websocket handler, as a transaction"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            with sentry_sdk.start_transaction(op="websocket", name=name):
+                try:
+                    result = await func(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    sampler.record(name, time.perf_counter() - start, failed)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """Reports each request's latency and outcome to the sampler by url name"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        sampler.record(
+            match.url_name or match.view_name if match else "unmatched",
+            time.perf_counter() - start,
+            response.status_code >= 500,
+        )
+        return response
+
+
+class StackProfiler:
+    """Samples one thread's stack from a background thread.
+
+    Stacks are counted in the folded format flame graph tools read, outermost
+    frame first. Nothing runs in the profiled thread, so it can be pointed at a
+    busy event loop.
+    """
+
+    def __init__(self, thread_id, interval_ms=5):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+
+    def sample(self, seconds):
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stacks[self.fold(frame)] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    @staticmethod
+    def fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(
+                f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+            )
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    @staticmethod
+    def report(stacks, top=20):
+        total = sum(stacks.values()) or 1
+        return "\n".join(
+            f"{count / total:6.1%} {count:6d} {stack}"
+            for stack, count in stacks.most_common(top)
+        )
+
+
+def install_profile_signal(signum=signal.SIGUSR2):
+    """Profile the calling thread, normally the event loop's, on each signal"""
+    profiler = StackProfiler(threading.get_ident(), PROFILE_INTERVAL_MS)
+
+    def profile():
+        stacks = profiler.sample(PROFILE_SECONDS)
+        logger.info(
+            f"Hot stacks over {PROFILE_SECONDS}s ({sum(stacks.values())} samples):\n"
+            f"{StackProfiler.report(stacks)}"
+        )
+
+    def handler(signum, frame):
+        threading.Thread(target=profile, daemon=True).start()
+
+    signal.signal(signum, handler)
@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from app.metrics import metrics_view
 from feedback.views import SendEmailView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("game/", include("game.urls")),
     path("feedback/", SendEmailView.as_view(), name="feedback_email"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
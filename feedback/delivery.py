@@ -0,0 +1,136 @@
+import logging
+import os
+from datetime import timedelta
+
+import sentry_sdk
+from django.core.mail import EmailMessage, get_connection
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from feedback.models import FeedbackMessage
+
+logger = logging.getLogger("feedback")
+
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", 50))
+FEEDBACK_MAX_ATTEMPTS = int(os.getenv("FEEDBACK_MAX_ATTEMPTS", 5))
+# Delay before the first retry, doubling with each failed attempt
+FEEDBACK_RETRY_SECONDS = float(os.getenv("FEEDBACK_RETRY_SECONDS", 30))
+# When set, feedback is held and sent as one digest email once the oldest
+# pending message is this many seconds old
+FEEDBACK_DIGEST_SECONDS = float(os.getenv("FEEDBACK_DIGEST_SECONDS", 0))
+
+SUBJECT = "Bingo App Feedback"
+
+
+def format_feedback(feedback):
+    body = f"Message:\n{feedback.message}"
+    if feedback.name or feedback.email:
+        body += f"\n\nFrom: {feedback.name} <{feedback.email}>"
+    return body
+
+
+def build_email(feedbacks, connection):
+    if len(feedbacks) == 1:
+        (feedback,) = feedbacks
+        subject = SUBJECT
+        body = format_feedback(feedback)
+        reply_to = [feedback.email] if feedback.email else None
+    else:
+        subject = f"{SUBJECT} digest ({len(feedbacks)} messages)"
+        body = "\n\n---\n\n".join(
+            f"Received {feedback.created_at:%Y-%m-%d %H:%M} UTC\n"
+            f"{format_feedback(feedback)}"
+            for feedback in feedbacks
+        )
+        reply_to = None
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=os.getenv("HOST_USER_EMAIL"),
+        to=[os.getenv("HOST_USER_EMAIL")],
+        reply_to=reply_to,
+        connection=connection,
+    )
+
+
+def retry(feedbacks, error, now):
+    for feedback in feedbacks:
+        feedback.attempts += 1
+        feedback.last_error = str(error)
+        if feedback.attempts >= FEEDBACK_MAX_ATTEMPTS:
+            feedback.status = FeedbackMessage.FAILED
+        else:
+            feedback.next_attempt_at = now + timedelta(
+                seconds=FEEDBACK_RETRY_SECONDS * 2 ** (feedback.attempts - 1)
+            )
+        feedback.save(
+            update_fields=["attempts", "last_error", "status", "next_attempt_at"]
+        )
+    failed = [f.id for f in feedbacks if f.status == FeedbackMessage.FAILED]
+    if failed:
+        logger.exception(
+            f"Failed feedback delivery, Feedback: {failed}", exc_info=error
+        )
+        sentry_sdk.capture_exception(error)
+    else:
+        logger.warning(
+            f"deliver_pending(), Feedback: {[f.id for f in feedbacks]}, retrying: {error}"
+        )
+
+
+def deliver_pending(batch_size=None, digest_seconds=None, now=None):
+    """Emails the feedback that is due, returning how many messages were sent.
+
+    Due rows stay locked, skipped by other workers, until they are marked
+    sent or rescheduled, so no feedback is sent twice. Failed sends are
+    retried with exponential backoff up to FEEDBACK_MAX_ATTEMPTS.
+    """
+    batch_size = batch_size or FEEDBACK_BATCH_SIZE
+    digest_seconds = (
+        FEEDBACK_DIGEST_SECONDS if digest_seconds is None else digest_seconds
+    )
+    now = now or timezone.now()
+
+    with transaction.atomic(using=router.db_for_write(FeedbackMessage)):
+        due = list(
+            FeedbackMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=FeedbackMessage.PENDING, next_attempt_at__lte=now)
+            .order_by("created_at", "id")[:batch_size]
+        )
+        if not due:
+            return 0
+        if digest_seconds:
+            if due[0].created_at > now - timedelta(seconds=digest_seconds):
+                return 0
+            groups = [due]
+        else:
+            groups = [[feedback] for feedback in due]
+
+        sent = 0
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            retry(due, e, now)
+            return 0
+        try:
+            for feedbacks in groups:
+                try:
+                    build_email(feedbacks, connection).send(fail_silently=False)
+                except Exception as e:
+                    retry(feedbacks, e, now)
+                    continue
+                FeedbackMessage.objects.filter(
+                    id__in=[feedback.id for feedback in feedbacks]
+                ).update(
+                    status=FeedbackMessage.SENT,
+                    sent_at=now,
+                    attempts=F("attempts") + 1,
+                )
+                sent += len(feedbacks)
+        finally:
+            connection.close()
+
+    logger.info(f"deliver_pending(), Sent: {sent}, Emails: {len(groups)}")
+    return sent
@@ -0,0 +1,40 @@
+import logging
+import time
+
+import sentry_sdk
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from feedback.delivery import deliver_pending
+
+logger = logging.getLogger("feedback")
+
+
+class Command(BaseCommand):
+    help = (
+        "Emails queued feedback, retrying failed sends with backoff. Runs until "
+        "stopped unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when no feedback is due.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = deliver_pending()
+            except Exception as e:
+                logger.exception("Unexpected error delivering feedback", exc_info=e)
+                sentry_sdk.capture_exception(e)
+                sent = 0
+            if options["once"]:
+                break
+            if not sent:
+                time.sleep(options["interval"])
+            close_old_connections()
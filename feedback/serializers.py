@@ -0,0 +1,9 @@
+from rest_framework import serializers
+
+from feedback.models import FeedbackMessage
+
+
+class FeedbackMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FeedbackMessage
+        fields = ["name", "email", "message"]
@@ -1,23 +1,39 @@
+from datetime import timedelta
 from unittest.mock import patch
 
 from django.core import mail
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from feedback.delivery import FEEDBACK_MAX_ATTEMPTS, deliver_pending
+from feedback.models import FeedbackMessage
 
+
+@patch.dict("os.environ", {"HOST_USER_EMAIL": "feedback@example.com"})
 class EmailServiceTests(APITestCase):
+    data = {
+        "name": "Test User",
+        "email": "test@example.com",
+        "message": "This is a test message.",
+    }
+
     def test_send_email_success(self):
-        """Recieve 200 status code when sending email with valid inputs"""
-        data = {
-            "name": "Test User",
-            "email": "test@example.com",
-            "message": "This is a test message.",
-        }
-        response = self.client.post(reverse("send_email"), data, format="json")
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data["message"], "Email sent successfully!")
+        """Recieve 202 status code and the email is sent by the delivery worker"""
+        response = self.client.post(reverse("feedback_email"), self.data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["message"], "Feedback received!")
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("deliver_feedback", once=True)
+
         self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["feedback@example.com"])
+        self.assertIn("This is a test message.", mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].reply_to, ["test@example.com"])
+        self.assertEqual(FeedbackMessage.objects.get().status, FeedbackMessage.SENT)
 
     def test_send_email_invalid(self):
         """Recieve 400 status code when sending email with invalid inputs"""
@@ -26,19 +42,47 @@ class EmailServiceTests(APITestCase):
             "email": "invalid-email",
             "message": "",
         }
-        response = self.client.post(reverse("send_email"), data, format="json")
+        response = self.client.post(reverse("feedback_email"), data, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FeedbackMessage.objects.exists())
 
+    @patch("feedback.delivery.sentry_sdk.capture_exception")
     @patch("django.core.mail.EmailMessage.send")
-    def test_send_email_error(self, mock_send):
-        """Recieve 500 status code when SMTP error occurs during email send"""
+    def test_send_email_error(self, mock_send, mock_capture):
+        """Failed sends are retried with backoff, then marked failed"""
         mock_send.side_effect = Exception("SMTP error")
+        self.client.post(reverse("feedback_email"), self.data, format="json")
+        now = timezone.now()
 
-        data = {
-            "name": "Test User",
-            "email": "test@example.com",
-            "message": "This is a test message.",
-        }
-        response = self.client.post(reverse("send_email"), data, format="json")
-        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
-        self.assertEqual(response.data["error"], "SMTP error")
+        self.assertEqual(deliver_pending(now=now), 0)
+        feedback = FeedbackMessage.objects.get()
+        self.assertEqual(feedback.status, FeedbackMessage.PENDING)
+        self.assertEqual(feedback.last_error, "SMTP error")
+        self.assertEqual(feedback.next_attempt_at, now + timedelta(seconds=30))
+        self.assertEqual(deliver_pending(now=now), 0)
+        self.assertEqual(mock_send.call_count, 1)
+
+        for _ in range(FEEDBACK_MAX_ATTEMPTS - 1):
+            now += timedelta(days=1)
+            deliver_pending(now=now)
+
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.status, FeedbackMessage.FAILED)
+        self.assertEqual(feedback.attempts, FEEDBACK_MAX_ATTEMPTS)
+        mock_capture.assert_called_once()
+
+    def test_digest(self):
+        """Pending feedback is rolled up into one email once the oldest is due"""
+        for i in range(3):
+            FeedbackMessage.objects.create(message=f"Message {i}")
+        now = timezone.now()
+
+        self.assertEqual(deliver_pending(digest_seconds=60, now=now), 0)
+        self.assertEqual(
+            deliver_pending(digest_seconds=60, now=now + timedelta(seconds=61)), 3
+        )
+
+        (email,) = mail.outbox
+        self.assertIn("digest (3 messages)", email.subject)
+        for i in range(3):
+            self.assertIn(f"Message {i}", email.body)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+
+import msgpack
+import sentry_sdk
+
+from app import metrics
+
+logger = logging.getLogger("game")
+
+
+class BroadcastCoalescer:
+    """Merges task updates for a game group into one group_send per window.
+
+    The first update for a group opens a window; updates arriving before it
+    closes are de-duplicated by task id, keeping the highest version, and
+    published as a single batched event. A window holding one update is
+    published in the unbatched shape so existing clients see no difference.
+    Bingo and leaderboard events sent while a window is open are held and
+    published after it, so they never overtake the task update they follow.
+    """
+
+    def __init__(self, enabled=False, window_ms=25):
+        self.enabled = enabled
+        self.window = window_ms / 1000
+        self.pending = {}
+        self.following = {}
+
+    async def send(self, channel_layer, group_name, task, delta):
+        if not self.enabled:
+            with metrics.group_send_seconds.labels("task").time():
+                await channel_layer.group_send(group_name, self.event([(task, delta)]))
+            return
+
+        pending = self.pending.get(group_name)
+        if pending is None:
+            pending = self.pending[group_name] = {}
+            asyncio.create_task(self.flush_after_window(channel_layer, group_name))
+        current = pending.get(task["id"])
+        if current is None or delta[3] >= current[1][3]:
+            pending[task["id"]] = (task, delta)
+
+    async def send_after(self, channel_layer, group_name, event, label):
+        """Publish an event after the task updates already sent to the group"""
+        if self.enabled and group_name in self.pending:
+            self.following.setdefault(group_name, []).append((event, label))
+            return
+        with metrics.group_send_seconds.labels(label).time():
+            await channel_layer.group_send(group_name, event)
+
+    async def flush_after_window(self, channel_layer, group_name):
+        await asyncio.sleep(self.window)
+        updates = list(self.pending.pop(group_name, {}).values())
+        following = self.following.pop(group_name, [])
+        try:
+            with metrics.group_send_seconds.labels("task").time():
+                await channel_layer.group_send(group_name, self.event(updates))
+            for event, label in following:
+                with metrics.group_send_seconds.labels(label).time():
+                    await channel_layer.group_send(group_name, event)
+        except Exception as e:
+            logger.exception("Failed coalesced task update broadcast", exc_info=e)
+            sentry_sdk.capture_exception(e)
+
+    @staticmethod
+    def event(updates):
+        if len(updates) == 1:
+            task, delta = updates[0]
+            return {
+                "type": "send_task_update",
+                "task": task,
+                "delta": msgpack.packb(delta),
+            }
+        return {
+            "type": "send_task_update",
+            "tasks": [task for task, _ in updates],
+            "delta": msgpack.packb([delta for _, delta in updates]),
+        }
+
+
+broadcast = BroadcastCoalescer(
+    enabled=os.getenv("BROADCAST_COALESCE", "false").lower() == "true",
+    window_ms=int(os.getenv("BROADCAST_COALESCE_WINDOW_MS", 25)),
+)
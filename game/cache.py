@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+from collections import defaultdict
+
+import redis
+import sentry_sdk
+from django.conf import settings
+
+logger = logging.getLogger("game")
+
+
+BOARD_CACHE_TIMEOUT = int(os.getenv("BOARD_CACHE_TIMEOUT", 86400))
+
+# Boards and leaderboards live on the first node, so they still resolve when
+# only REDIS_URLS is set
+r = redis.StrictRedis.from_url(settings.REDIS_URLS[0], decode_responses=True)
+
+# A leaderboard is a sorted set of completed task counts per player, plus a
+# "version" member holding the game version it was counted at. Completions
+# scored before it is built are kept as (version, player, previous player)
+# deltas, and the build applies those newer than its count, so a completion
+# is counted exactly once whichever side of the build it lands on
+_score_completion = r.register_script(
+    """
+    local built = redis.call("ZSCORE", KEYS[1], "version")
+    if not built then
+        redis.call("RPUSH", KEYS[2], ARGV[4], ARGV[1], ARGV[2])
+        redis.call("EXPIRE", KEYS[2], ARGV[3])
+        return {}
+    end
+    if tonumber(ARGV[4]) <= tonumber(built) then
+        return {}
+    end
+    local scores = {ARGV[1], redis.call("ZINCRBY", KEYS[1], 1, ARGV[1])}
+    if ARGV[2] ~= "" then
+        table.insert(scores, ARGV[2])
+        table.insert(scores, redis.call("ZINCRBY", KEYS[1], -1, ARGV[2]))
+    end
+    redis.call("EXPIRE", KEYS[1], ARGV[3])
+    return scores
+    """
+)
+_build_leaderboard = r.register_script(
+    """
+    if redis.call("EXISTS", KEYS[1]) == 1 then
+        return 0
+    end
+    redis.call("ZADD", KEYS[1], ARGV[2], "version", unpack(ARGV, 3))
+    local deltas = redis.call("LRANGE", KEYS[2], 0, -1)
+    for i = 1, #deltas, 3 do
+        if tonumber(deltas[i]) > tonumber(ARGV[2]) then
+            redis.call("ZINCRBY", KEYS[1], 1, deltas[i + 1])
+            if deltas[i + 2] ~= "" then
+                redis.call("ZINCRBY", KEYS[1], -1, deltas[i + 2])
+            end
+        end
+    end
+    redis.call("DEL", KEYS[2])
+    redis.call("EXPIRE", KEYS[1], ARGV[1])
+    return 1
+    """
+)
+
+
+def board_key(code):
+    return f"board_{code}"
+
+
+def get_board(code):
+    """Return the cached board for a game code, or None on a miss.
+
+    Boards are stored as a hash with one field per player and task so that
+    concurrent writers only ever replace their own field. A hash without the
+    "game" field is a partial entry left by a write-through and counts as a miss.
+    """
+    try:
+        fields = r.hgetall(board_key(code))
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to read board snapshot from cache", exc_info=e)
+        return None
+
+    if "game" not in fields:
+        return None
+
+    board = json.loads(fields.pop("game"))
+    players = []
+    grouped_tasks = defaultdict(list)
+    for field, value in fields.items():
+        kind, _, _ = field.partition(":")
+        value = json.loads(value)
+        if kind == "player":
+            players.append(value)
+        elif kind == "task":
+            grouped_tasks[value["grid_row"]].append(value)
+
+    board["players"] = sorted(players, key=lambda player: player["id"])
+    board["tasks"] = [
+        sorted(grouped_tasks[row], key=lambda task: task["grid_column"])
+        for row in sorted(grouped_tasks.keys())
+    ]
+    return board
+
+
+def set_board(board):
+    """Cache a board serialized by GameSerializer.
+
+    Fields are only written if absent, so a snapshot built from an older read
+    never overwrites a task or player already written through by a newer update.
+    """
+    key = board_key(board["code"])
+    try:
+        pipe = r.pipeline(transaction=False)
+        for player in board["players"]:
+            pipe.hsetnx(key, f"player:{player['id']}", json.dumps(player))
+        for row in board["tasks"]:
+            for task in row:
+                pipe.hsetnx(key, f"task:{task['id']}", json.dumps(task))
+        pipe.hset(
+            key,
+            "game",
+            json.dumps(
+                {"id": board["id"], "code": board["code"], "title": board["title"]}
+            ),
+        )
+        pipe.expire(key, BOARD_CACHE_TIMEOUT)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to write board snapshot to cache", exc_info=e)
+
+
+def set_task(code, task):
+    """Write-through a single task serialized by TaskSerializer."""
+    _set_field(code, f"task:{task['id']}", task)
+
+
+def add_player(code, player):
+    """Write-through a player serialized by PlayerSerializer."""
+    _set_field(code, f"player:{player['id']}", player)
+
+
+def leaderboard_key(code):
+    return f"leaderboard_{code}"
+
+
+def leaderboard_deltas_key(code):
+    return f"leaderboard_{code}_deltas"
+
+
+def get_leaderboard(code):
+    """Return {player_id: completed tasks} for a game code, or None on a miss."""
+    try:
+        scores = dict(r.zrange(leaderboard_key(code), 0, -1, withscores=True))
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to read leaderboard from cache", exc_info=e)
+        return None
+    if scores.pop("version", None) is None:
+        return None
+    return {int(player_id): int(completed) for player_id, completed in scores.items()}
+
+
+def set_leaderboard(code, scores, version):
+    """Cache a leaderboard counted from the database at a game version, unless
+    one is already built."""
+    if not scores:
+        return
+    args = [BOARD_CACHE_TIMEOUT, version]
+    for player_id, completed in scores.items():
+        args += [completed, player_id]
+    try:
+        _build_leaderboard(
+            keys=[leaderboard_key(code), leaderboard_deltas_key(code)], args=args
+        )
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to write leaderboard to cache", exc_info=e)
+
+
+def score_completion(code, version, player_id, previous_player_id=None):
+    """Credit a completion at a game version to player_id, taking it from
+    previous_player_id.
+
+    Returns {player_id: completed tasks} for the players whose scores changed,
+    or {} when the game's leaderboard is not built or already counts it.
+    """
+    if previous_player_id == player_id:
+        return {}
+    try:
+        scores = _score_completion(
+            keys=[leaderboard_key(code), leaderboard_deltas_key(code)],
+            args=[player_id, previous_player_id or "", BOARD_CACHE_TIMEOUT, version],
+        )
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to update leaderboard", exc_info=e)
+        return {}
+    return {
+        int(player): int(float(completed))
+        for player, completed in zip(scores[::2], scores[1::2])
+    }
+
+
+def delete_board(code):
+    try:
+        r.delete(board_key(code))
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to invalidate board snapshot", exc_info=e)
+
+
+def _set_field(code, field, value):
+    key = board_key(code)
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(key, field, json.dumps(value))
+        pipe.expire(key, BOARD_CACHE_TIMEOUT)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        sentry_sdk.capture_exception(e)
+        logger.exception("Failed to write-through board snapshot", exc_info=e)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+CODE_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890"
+CODE_LENGTH = 6
+# Codes are permuted as two halves of three characters each
+HALF_SPACE = len(CODE_ALPHABET) ** (CODE_LENGTH // 2)
+CODE_SPACE = HALF_SPACE**2
+ROUNDS = 4
+
+
+def code_key(secret):
+    """Key for the permutation's round function, derived from a non-empty secret.
+
+    Anyone knowing the key can list every code in issue order, so an empty
+    secret is refused rather than falling back to an unkeyed hash.
+    """
+    if not secret:
+        raise ImproperlyConfigured(
+            "Game codes need GAME_CODE_KEY or SECRET_KEY to be set"
+        )
+    return hashlib.blake2b(
+        secret.encode("utf8"), digest_size=32, person=b"bingo.game_code"
+    ).digest()
+
+
+# Changing the key reorders the whole code space, so previously issued codes
+# become possible collisions; Game.create_with_unique_code skips those
+GAME_CODE_KEY = code_key(os.getenv("GAME_CODE_KEY") or settings.SECRET_KEY)
+GAME_CODE_BLOCK_SIZE = int(os.getenv("GAME_CODE_BLOCK_SIZE", 32))
+
+
+def round_value(index, half):
+    digest = hashlib.blake2b(
+        half.to_bytes(4, "big"), key=GAME_CODE_KEY, salt=bytes([index]), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") % HALF_SPACE
+
+
+def permute(number):
+    """Keyed Feistel permutation of range(CODE_SPACE) onto itself"""
+    left, right = divmod(number, HALF_SPACE)
+    for index in range(ROUNDS):
+        left, right = right, (left + round_value(index, right)) % HALF_SPACE
+    return left * HALF_SPACE + right
+
+
+def encode(number):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class CodeAllocator:
+    """Hands out game codes from the game_code_seq sequence.
+
+    Each sequence value maps to a distinct code, so codes never collide with
+    each other. Values are reserved a block at a time so most codes cost no
+    database round trip; values left in a block when the process exits are
+    simply never used.
+    """
+
+    def __init__(self, block_size=32):
+        self.block_size = block_size
+        self.values = []
+        self.lock = threading.Lock()
+
+    def next_code(self):
+        with self.lock:
+            if not self.values:
+                self.values = self.reserve()
+            return encode(permute(self.values.pop()))
+
+    def reserve(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval('game_code_seq') FROM generate_series(1, %s)",
+                [self.block_size],
+            )
+            return sorted((row[0] for row in cursor.fetchall()), reverse=True)
+
+
+code_allocator = CodeAllocator(block_size=GAME_CODE_BLOCK_SIZE)
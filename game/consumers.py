@@ -2,134 +2,547 @@ import asyncio
 import json
 import logging
 import os
+import time
+from datetime import datetime, timezone
 
+import msgpack
 import redis.asyncio as redis
 import sentry_sdk
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.layers import get_channel_layer
 from dateutil import parser
+from django.conf import settings
 from django.forms.models import model_to_dict
+from redis.exceptions import RedisError
 
-from game.models import Player, Task
+from app import metrics
+from app.tracing import traced
+from game import cache
+from game.broadcast import broadcast
+from game.diagnostics import dump_queue, log_queue
+from game.flowcontrol import OutboundBuffer, TokenBucket
+from game.models import Game, Task
+from game.serializers import BoardSerializer, serialize_task, task_delta
+from game.sharding import jump_hash
+from game.writebehind import write_behind
 
 logger = logging.getLogger("game")
 
 
-r_pool = redis.ConnectionPool.from_url(os.getenv("REDIS_URL"), decode_responses=True)
-r = redis.StrictRedis.from_pool(r_pool)
+r_pools = [
+    redis.ConnectionPool.from_url(url, decode_responses=True)
+    for url in settings.REDIS_URLS
+]
+shards = [redis.StrictRedis.from_pool(pool) for pool in r_pools]
+
+OFFLINE_STREAM_MAXLEN = int(os.getenv("OFFLINE_STREAM_MAXLEN", 1000))
+# Reconnecting players missing more entries than this are told to resync
+OFFLINE_REPLAY_MAX = int(os.getenv("OFFLINE_REPLAY_MAX", 200))
+# Seconds every offline queue key outlives the last write to it
+OFFLINE_QUEUE_TTL = int(os.getenv("OFFLINE_QUEUE_TTL", 86400))
+# Broadcast leaderboard score changes alongside task updates
+LEADERBOARD_EVENTS = os.getenv("LEADERBOARD_EVENTS", "false").lower() == "true"
+# How reconnecting players catch up: "replay" sends each missed entry as its
+# own frame, "merged" sends them as one batched frame (or the board when they
+# can't be replayed) and "snapshot" sends the whole board on every connect
+CATCH_UP_MODE = os.getenv("CATCH_UP_MODE", "replay").lower()
+# Completion frames a connection may send per second, 0 (the default) for no
+# limit, and the burst allowed above that rate; excess frames are dropped, or
+# with the reject policy answered with
+# {"rejected": {"id": ..., "reason": "rate_limited"}}
+INBOUND_RATE_LIMIT = float(os.getenv("INBOUND_RATE_LIMIT", 0))
+INBOUND_RATE_BURST = int(os.getenv("INBOUND_RATE_BURST", 20))
+INBOUND_RATE_POLICY = os.getenv("INBOUND_RATE_POLICY", "drop").lower()
+# Group messages a connection may have waiting before it is told to resync
+OUTBOUND_BUFFER_MAX = int(os.getenv("OUTBOUND_BUFFER_MAX", 100))
+# Players without a heartbeat for this long are treated as disconnected
+PRESENCE_TIMEOUT_MS = int(os.getenv("PRESENCE_TIMEOUT_MS", 60000))
+
+# Opt-in subprotocol that sends each task update as a MessagePack array of
+# [task id, completed_by id, last_updated epoch ms, game version], or an array
+# of those arrays when coalesced updates are batched into one frame
+MSGPACK_SUBPROTOCOL = "bingo.msgpack.v1"
+# Close code for binary frames that aren't a MessagePack completion
+UNSUPPORTED_DATA = 1003
+
+
+# Keeps one stream entry per task by deleting the task's previous entry, found
+# in the latest hash, whenever a newer one is appended. Bingos get their own
+# entries so compaction never drops them. History lost to trimming can't be
+# replayed, so the latest hash also records the id the stream now starts at.
+_enqueue_message = shards[0].register_script(
+    """
+    local previous = redis.call("HGET", KEYS[2], ARGV[1])
+    if previous then
+        redis.call("XDEL", KEYS[1], previous)
+    end
+    local fields = {"task", ARGV[4]}
+    if ARGV[5] ~= "" then
+        table.insert(fields, "delta")
+        table.insert(fields, ARGV[5])
+    end
+    redis.call("HSET", KEYS[2], ARGV[1], redis.call("XADD", KEYS[1], "*", unpack(fields)))
+    if ARGV[6] ~= "" then
+        redis.call("XADD", KEYS[1], "*", "bingo", ARGV[6])
+    end
+    if redis.call("XTRIM", KEYS[1], "MAXLEN", ARGV[2]) > 0 then
+        local first = redis.call("XRANGE", KEYS[1], "-", "+", "COUNT", 1)[1]
+        if first then
+            redis.call("HSET", KEYS[2], "trimmed", first[1])
+        end
+    end
+    redis.call("EXPIRE", KEYS[1], ARGV[3])
+    redis.call("EXPIRE", KEYS[2], ARGV[3])
+    return redis.call("XLEN", KEYS[1])
+    """
+)
+
+# Presence is scored with Redis's clock rather than the app server's, so the
+# heartbeat cursors built from scores line up with the stream's entry ids
+_refresh_presence = shards[0].register_script(
+    """
+    redis.replicate_commands()
+    local now = redis.call("TIME")
+    local milliseconds = string.format("%.0f", now[1] * 1000 + math.floor(now[2] / 1000))
+    redis.call("ZADD", KEYS[1], milliseconds, ARGV[1])
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+    """
+)
+
+# Pops the players whose last heartbeat is older than the timeout, by Redis's
+# clock, returning their ids and scores
+_evict_stale_presence = shards[0].register_script(
+    """
+    redis.replicate_commands()
+    local now = redis.call("TIME")
+    local stale = string.format("%.0f", now[1] * 1000 + math.floor(now[2] / 1000) - ARGV[1])
+    local evicted = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", "(" .. stale, "WITHSCORES")
+    redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", "(" .. stale)
+    return evicted
+    """
+)
+
+
+def stream_id(entry_id):
+    milliseconds, _, sequence = entry_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def heartbeat_cursor(last_seen):
+    """Stream cursor just before a heartbeat, for replaying everything after it"""
+    return f"{int(last_seen) - 1}-{2**64 - 1}"
 
 
 class TaskUpdatesConsumer(AsyncWebsocketConsumer):
+    binary = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inbound = TokenBucket(INBOUND_RATE_LIMIT, INBOUND_RATE_BURST)
+        self.outbound = OutboundBuffer(super().dispatch, OUTBOUND_BUFFER_MAX)
+
     async def connect(self):
         self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
         self.player_id = self.scope["url_route"]["kwargs"]["player_id"]
         self.group_name = f"game_{self.game_id}"
 
+        self.binary = MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", [])
+
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+        metrics.connection_opened(self.game_id)
 
         asyncio.create_task(self.send_queued_messages())
 
     async def disconnect(self, close_code):
+        self.outbound.close()
+        metrics.connection_closed(self.game_id)
         asyncio.create_task(self.add_player_to_queue())
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    async def receive(self, text_data):
-        if text_data == "heartbeat":
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            completion = self.decode_completion(bytes_data)
+            if completion is None:
+                logger.warning(f"receive(), Player: {self.player_id}, bad binary frame")
+                await self.close(code=UNSUPPORTED_DATA)
+                return
+            task_id, player_id, last_updated = completion
+        elif text_data == "heartbeat":
+            await self.refresh_presence()
             await self.send(text_data=json.dumps({"message": "thump"}))
             return
+        elif text_data == "presence":
+            await self.send_presence()
+            return
+        else:
+            data = json.loads(text_data)
+            task_id = data.get("id")
+            player_id = data.get("completed_by").get("id")
+            last_updated = data.get("last_updated")
+
+        if not self.inbound.take():
+            logger.warning(f"receive(), Player: {self.player_id}, rate limited")
+            if INBOUND_RATE_POLICY == "reject":
+                await self.send(
+                    text_data=json.dumps(
+                        {"rejected": {"id": task_id, "reason": "rate_limited"}}
+                    )
+                )
+            return
+        await self.complete_task(task_id, player_id, last_updated)
+
+    def decode_completion(self, bytes_data):
+        """(task id, completed_by id, last_updated) from a MessagePack
+        [task id, completed_by id, last_updated epoch ms] frame, or None when
+        the connection didn't negotiate the subprotocol or the frame is invalid"""
+        if not self.binary:
+            return None
+        try:
+            task_id, player_id, last_updated_ms = msgpack.unpackb(bytes_data)
+            last_updated = datetime.fromtimestamp(last_updated_ms / 1000, timezone.utc)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        return task_id, player_id, last_updated.isoformat()
 
-        data = json.loads(text_data)
-        task_id = data.get("id")
-        player_id = data.get("completed_by").get("id")
-        last_updated = data.get("last_updated")
-        task = await self.update_task(task_id, player_id, last_updated)
+    @traced("websocket.complete_task")
+    async def complete_task(self, task_id, player_id, last_updated):
+        """Complete a task and publish the update and any bingo to the game"""
+        with metrics.update_task_seconds.time():
+            if write_behind.enabled:
+                task = await self.commit_task(task_id, player_id, last_updated)
+            else:
+                task = await self.update_task(task_id, player_id, last_updated)
 
         if task:
-            asyncio.create_task(self.enqueue_message(task))
-            await self.channel_layer.group_send(
-                self.group_name, {"type": "send_task_update", "task": task}
-            )
+            task_dict = model_to_dict(task)
+            task_dict["completed_by"] = model_to_dict(task.completed_by)
+            delta = task_delta(task)
+            bingo = None
+            if task.lines:
+                bingo = {
+                    "task": task.id,
+                    "player": task_dict["completed_by"],
+                    "lines": task.lines,
+                }
+            asyncio.create_task(self.enqueue_message(task_dict, delta, bingo))
+            await broadcast.send(self.channel_layer, self.group_name, task_dict, delta)
+            if bingo:
+                await broadcast.send_after(
+                    self.channel_layer,
+                    self.group_name,
+                    {"type": "send_bingo", "bingo": bingo},
+                    "bingo",
+                )
+            if LEADERBOARD_EVENTS and task.scores:
+                await broadcast.send_after(
+                    self.channel_layer,
+                    self.group_name,
+                    {
+                        "type": "send_leaderboard",
+                        "scores": [
+                            {"id": player_id, "completed": completed}
+                            for player_id, completed in task.scores.items()
+                        ],
+                    },
+                    "leaderboard",
+                )
+
+    @property
+    def r(self):
+        """Redis node holding this game's offline queue, placed like its channel group"""
+        return shards[jump_hash(self.group_name, len(shards))]
+
+    async def dispatch(self, message):
+        """Group messages are written through the outbound buffer, so a slow client
+        can't stall its channel and newer updates replace waiting ones for a task"""
+        if message["type"] == "send_task_update" and "task" in message:
+            self.outbound.put(message, key=message["task"]["id"])
+        elif message["type"] in ("send_task_update", "send_bingo", "send_leaderboard"):
+            self.outbound.put(message)
+        else:
+            await super().dispatch(message)
 
     async def send_task_update(self, event):
-        await self.send(text_data=json.dumps({"task": event["task"]}))
+        if self.binary and "delta" in event:
+            await self.send(bytes_data=event["delta"])
+        elif "tasks" in event:
+            await self.send(text_data=json.dumps({"tasks": event["tasks"]}))
+        else:
+            await self.send(text_data=json.dumps({"task": event["task"]}))
+
+    async def send_bingo(self, event):
+        await self.send(text_data=json.dumps({"bingo": event["bingo"]}))
+
+    async def send_leaderboard(self, event):
+        await self.send(text_data=json.dumps({"leaderboard": event["scores"]}))
+
+    async def send_resync(self, event):
+        await self.send(text_data=json.dumps({"resync": True}))
 
     @database_sync_to_async
     def update_task(self, task_id, player_id, last_updated):
-        task_dict = {}
+        """Returns the completed Task, or None if the completion lost or failed"""
+        task = None
         try:
-            task = Task.objects.get(id=task_id)
-            last_updated = parser.parse(last_updated)
-            if (
-                task.completed
-                and last_updated < task.last_updated
-                or not task.completed
-            ):
-                player = Player.objects.get(id=player_id)
-                task.completed_by = player
-                task.last_updated = last_updated
-                if not task.completed:
-                    task.completed = True
-                task.save()
-                task_dict = model_to_dict(task)
-                task_dict["completed_by"] = model_to_dict(player)
+            task = Task.complete(task_id, player_id, parser.parse(last_updated))
+            if task:
+                self.record_completion(task)
         except Exception as e:
             logger.exception(
                 "Unknown exception during Task database update", exc_info=e
             )
             sentry_sdk.capture_exception(e)
-            task_dict = None
+            task = None
 
-        return task_dict
+        return task
 
-    async def add_player_to_queue(self):
+    async def commit_task(self, task_id, player_id, last_updated):
+        """Write-behind counterpart of update_task, returning the Task only once
+        the flush that writes it commits"""
+        sequence = await self.queue_task(task_id, player_id, last_updated)
+        if sequence is None:
+            return None
+        task = await write_behind.commit(sequence)
+        if task:
+            await database_sync_to_async(self.record_completion)(task)
+        return task
+
+    @database_sync_to_async
+    def queue_task(self, task_id, player_id, last_updated):
+        """Returns the write-behind sequence number, or None if the completion lost or failed"""
         try:
-            await r.rpush(f"{self.group_name}_queue", self.player_id)
-            await r.expire(f"{self.group_name}_queue", 86400)
-            logger.info(
-                f"add_player_to_queue(), Key: {self.group_name}, Queue: {await r.lrange(self.group_name, 0, -1)}"
+            return write_behind.complete(
+                self.game_id, task_id, player_id, parser.parse(last_updated)
             )
-        except redis.exceptions.RedisError as e:
+        except Exception as e:
+            logger.exception(
+                "Unknown exception during write-behind Task update", exc_info=e
+            )
+            sentry_sdk.capture_exception(e)
+            return None
+
+    def record_completion(self, task):
+        """Write the task through to the board cache and credit the leaderboard"""
+        cache.set_task(task.game.code, serialize_task(task))
+        task.scores = cache.score_completion(
+            task.game.code,
+            task.version,
+            task.completed_by.id,
+            task.previous_completed_by_id,
+        )
+
+    async def add_player_to_queue(self):
+        """Record the player's cursor into the game stream on disconnection"""
+        try:
+            stream_name = f"{self.group_name}_stream"
+            cursors_name = f"{self.group_name}_cursors"
+            last_entry = await self.r.xrevrange(stream_name, count=1)
+            cursor = last_entry[0][0] if last_entry else "0-0"
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.hset(cursors_name, self.player_id, cursor)
+                pipe.expire(cursors_name, OFFLINE_QUEUE_TTL)
+                pipe.zrem(f"{self.group_name}_presence", self.player_id)
+                await pipe.execute()
+            log_queue("add_player_to_queue", stream_name, cursor=cursor)
+            await self.evict_stale_presence()
+            await dump_queue(self.r, self.group_name)
+        except RedisError as e:
             sentry_sdk.capture_exception(e)
             logger.exception("Failed redis queue update on disconnection", exc_info=e)
 
-    async def enqueue_message(self, task):
-        """Enqueue message to all offline (disconnected) players"""
+    async def refresh_presence(self):
+        """Score the player in the game's presence set with the current time"""
         try:
-            queue_name = f"{self.group_name}_queue"
-            offline_player_ids = await r.lrange(queue_name, 0, -1)
-            for id in offline_player_ids:
-                await r.rpush(f"{self.group_name}_player_{id}", json.dumps(task))
-            logger.info(
-                f"enqueue_message(), Key: {queue_name}, Queue: {await r.lrange(queue_name, 0, -1)}"
+            await _refresh_presence(
+                keys=[f"{self.group_name}_presence"],
+                args=[self.player_id, OFFLINE_QUEUE_TTL],
+                client=self.r,
             )
-        except redis.exceptions.RedisError as e:
+        except RedisError as e:
             sentry_sdk.capture_exception(e)
-            logger.exception("Failed redis enqueue from recieved message", exc_info=e)
+            logger.exception("Failed redis presence refresh", exc_info=e)
 
-    async def send_queued_messages(self):
-        """Check if there are any messages in the queue for the user when they reconnect"""
+    async def evict_stale_presence(self):
+        """Move players whose heartbeats stopped without a disconnect to offline.
+
+        Each evicted player gets a cursor at their last heartbeat, so their
+        reconnection replays everything the dead socket may have missed.
+        """
+        presence_name = f"{self.group_name}_presence"
+        cursors_name = f"{self.group_name}_cursors"
+        evicted = await _evict_stale_presence(
+            keys=[presence_name], args=[PRESENCE_TIMEOUT_MS], client=self.r
+        )
+        evicted = list(zip(evicted[::2], evicted[1::2]))
+        if evicted:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for player_id, last_seen in evicted:
+                    pipe.hsetnx(cursors_name, player_id, heartbeat_cursor(last_seen))
+                pipe.expire(cursors_name, OFFLINE_QUEUE_TTL)
+                await pipe.execute()
+            log_queue("evict_stale_presence", presence_name, evicted=len(evicted))
+
+    async def presence(self):
+        """Returns the online and offline player ids of the game"""
+        await self.evict_stale_presence()
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.zrange(f"{self.group_name}_presence", 0, -1)
+            pipe.hkeys(f"{self.group_name}_cursors")
+            online, offline = await pipe.execute()
+        return online, offline
+
+    async def send_presence(self):
+        """Reply with the game's online and offline player ids"""
         try:
-            game_queue = f"{self.group_name}_queue"
-            player_queue = f"{self.group_name}_player_{self.player_id}"
-            logger.info(
-                f"send_queued_message(), Key: {player_queue}, Queue Before Loop: {await r.lrange(player_queue, 0, -1)}"
-            )
-            message = True
-            while message:
-                message = await r.lpop(player_queue)
-                if message:
-                    await self.send_task_update({"task": json.loads(message)})
-            logger.info(
-                f"send_queued_message(), Key: {player_queue}, Queue After Loop: {await r.lrange(player_queue, 0, -1)}"
+            online, offline = await self.presence()
+        except RedisError as e:
+            sentry_sdk.capture_exception(e)
+            logger.exception("Failed redis presence lookup", exc_info=e)
+            return
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "presence": {
+                        "online": [int(player_id) for player_id in online],
+                        "offline": [int(player_id) for player_id in offline],
+                    }
+                }
             )
-            await r.lrem(game_queue, 1, self.player_id)
-            logger.info(
-                f"send_queued_message(), Key: {game_queue}, Queue: {await r.lrange(game_queue, 0, -1)}"
+        )
+
+    async def enqueue_message(self, task, delta=None, bingo=None):
+        """Replace the task's entry in the game stream read by offline (disconnected) players"""
+        try:
+            stream_name = f"{self.group_name}_stream"
+            length = await _enqueue_message(
+                keys=[stream_name, f"{self.group_name}_latest"],
+                args=[
+                    task["id"],
+                    OFFLINE_STREAM_MAXLEN,
+                    OFFLINE_QUEUE_TTL,
+                    json.dumps(task),
+                    json.dumps(delta) if delta else "",
+                    json.dumps(bingo) if bingo else "",
+                ],
+                client=self.r,
             )
-        except redis.exceptions.RedisError as e:
+            metrics.offline_queue_length.labels(self.game_id).set(length)
+            log_queue("enqueue_message", stream_name, length=length)
+            await dump_queue(self.r, self.group_name)
+        except RedisError as e:
+            sentry_sdk.capture_exception(e)
+            logger.exception("Failed redis enqueue from recieved message", exc_info=e)
+
+    @traced("websocket.catch_up")
+    async def send_queued_messages(self):
+        """Catch the player up on connection with messages added to the game stream
+        since their cursor, as configured by CATCH_UP_MODE.
+
+        Players whose missed entries were trimmed, expired or exceed
+        OFFLINE_REPLAY_MAX are sent {"resync": true} to refetch the board instead.
+        """
+        start = time.perf_counter()
+        try:
+            stream_name = f"{self.group_name}_stream"
+            cursors_name = f"{self.group_name}_cursors"
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.hget(cursors_name, self.player_id)
+                pipe.zscore(f"{self.group_name}_presence", self.player_id)
+                pipe.hget(f"{self.group_name}_latest", "trimmed")
+                pipe.exists(stream_name)
+                cursor, last_seen, trimmed, stream_exists = await pipe.execute()
+            # A presence entry without a cursor means the previous socket closed
+            # without disconnect running, so replay from its last heartbeat
+            if not cursor and last_seen:
+                cursor = heartbeat_cursor(last_seen)
+            if CATCH_UP_MODE == "snapshot":
+                await self.send_board()
+            elif cursor:
+                entries = await self.r.xrange(
+                    stream_name, min=f"({cursor}", count=OFFLINE_REPLAY_MAX + 1
+                )
+                # A 0-0 cursor was taken before the stream existed, so a
+                # missing stream means nothing was missed rather than expired
+                if (
+                    (not stream_exists and cursor != "0-0")
+                    or (trimmed and stream_id(cursor) < stream_id(trimmed))
+                    or len(entries) > OFFLINE_REPLAY_MAX
+                ):
+                    if CATCH_UP_MODE == "merged":
+                        await self.send_board()
+                    else:
+                        await self.send_resync({})
+                    entries = []
+                elif CATCH_UP_MODE == "merged":
+                    await self.send_merged(entries)
+                else:
+                    for _, fields in entries:
+                        if "bingo" in fields:
+                            await self.send_bingo(
+                                {"bingo": json.loads(fields["bingo"])}
+                            )
+                            continue
+                        event = {"task": json.loads(fields["task"])}
+                        if "delta" in fields:
+                            event["delta"] = msgpack.packb(json.loads(fields["delta"]))
+                        await self.send_task_update(event)
+                metrics.replay_entries.observe(len(entries))
+                log_queue(
+                    "send_queued_messages",
+                    stream_name,
+                    cursor=cursor,
+                    sent=len(entries),
+                )
+            if cursor:
+                await self.r.hdel(cursors_name, self.player_id)
+            await self.refresh_presence()
+            metrics.replay_seconds.observe(time.perf_counter() - start)
+            await dump_queue(self.r, self.group_name)
+        except RedisError as e:
             sentry_sdk.capture_exception(e)
             logger.exception(
                 "Failed to send redis queue messages on connection", exc_info=e
             )
+
+    async def send_merged(self, entries):
+        """Send missed task updates as one batched frame, followed by any bingos"""
+        updates = []
+        bingos = []
+        for _, fields in entries:
+            if "bingo" in fields:
+                bingos.append(json.loads(fields["bingo"]))
+            else:
+                updates.append(
+                    (
+                        json.loads(fields["task"]),
+                        json.loads(fields.get("delta", "null")),
+                    )
+                )
+        if updates:
+            await self.send_task_update(broadcast.event(updates))
+        for bingo in bingos:
+            await self.send_bingo({"bingo": bingo})
+
+    async def send_board(self):
+        board = await self.load_board()
+        if board:
+            await self.send(text_data=json.dumps({"board": board}))
+
+    @database_sync_to_async
+    def load_board(self):
+        """Board as returned by join_game, from the cache or the database"""
+        try:
+            game = Game.objects.filter(id=self.game_id).only("code", "title").first()
+            if game is None:
+                return None
+            board = cache.get_board(game.code)
+            if board is None:
+                board = BoardSerializer(game).data
+                cache.set_board(board)
+            return board
+        except Exception as e:
+            logger.exception("Unknown exception loading board snapshot", exc_info=e)
+            sentry_sdk.capture_exception(e)
+            return None
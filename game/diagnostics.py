@@ -0,0 +1,61 @@
+import logging
+import os
+import random
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger("game.queue")
+
+# Share of offline queue operations followed by a DEBUG dump of the game's
+# queue state; dumps are the only diagnostics that cost Redis round trips
+QUEUE_DUMP_SAMPLE_RATE = float(os.getenv("QUEUE_DUMP_SAMPLE_RATE", 0))
+
+
+def log_queue(operation, key, **fields):
+    """Log an offline queue operation with values the caller already has.
+
+    Fields are attached to the record as queue_<name> for structured handlers,
+    and nothing is formatted unless INFO is enabled for game.queue.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info(
+        "%s(), Key: %s%s",
+        operation,
+        key,
+        "".join(f", {name.title()}: {value}" for name, value in fields.items()),
+        extra={
+            "queue_operation": operation,
+            "queue_key": key,
+            **{f"queue_{name}": value for name, value in fields.items()},
+        },
+    )
+
+
+async def dump_queue(r, group_name, sample_rate=None):
+    """Log a sample of operations' full queue state for the game at DEBUG"""
+    sample_rate = QUEUE_DUMP_SAMPLE_RATE if sample_rate is None else sample_rate
+    if (
+        not sample_rate
+        or random.random() >= sample_rate
+        or not logger.isEnabledFor(logging.DEBUG)
+    ):
+        return
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.xlen(f"{group_name}_stream")
+            pipe.xrevrange(f"{group_name}_stream", count=5)
+            pipe.hgetall(f"{group_name}_cursors")
+            pipe.zrange(f"{group_name}_presence", 0, -1, withscores=True)
+            length, recent, cursors, presence = await pipe.execute()
+    except RedisError as e:
+        logger.warning("dump_queue(), Group: %s, failed: %s", group_name, e)
+        return
+    logger.debug(
+        "dump_queue(), Group: %s, Length: %s, Recent: %s, Cursors: %s, Presence: %s",
+        group_name,
+        length,
+        [entry_id for entry_id, _ in recent],
+        cursors,
+        presence,
+    )
@@ -0,0 +1,125 @@
+import json
+import logging
+from collections import Counter
+
+import redis
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import router, transaction
+
+from game import cache
+from game.models import Game, Task
+from game.serializers import BoardSerializer
+from game.sharding import jump_hash
+
+logger = logging.getLogger("game")
+
+nodes = [
+    redis.StrictRedis.from_url(url, decode_responses=True)
+    for url in settings.REDIS_URLS
+]
+
+# Offline queue keys of a game, on the node its channel group hashes to
+QUEUE_KEY_SUFFIXES = ("stream", "latest", "cursors", "presence")
+
+
+def game_keys(game):
+    """Redis keys of a game by the node holding them"""
+    group_name = f"game_{game.id}"
+    keys = {}
+    node = nodes[jump_hash(group_name, len(nodes))]
+    keys[node] = [f"{group_name}_{suffix}" for suffix in QUEUE_KEY_SUFFIXES]
+    keys[node].append(get_channel_layer()._group_key(group_name).decode("utf8"))
+    keys.setdefault(cache.r, []).extend(
+        [
+            cache.board_key(game.code),
+            cache.leaderboard_key(game.code),
+            cache.leaderboard_deltas_key(game.code),
+        ]
+    )
+    return keys
+
+
+def drop_redis_keys(games):
+    """Unlinks the games' queue, group, board and leaderboard keys, returning
+    how many existed"""
+    by_node = {}
+    for game in games:
+        for node, keys in game_keys(game).items():
+            by_node.setdefault(node, []).extend(keys)
+    dropped = 0
+    for node, keys in by_node.items():
+        try:
+            dropped += node.unlink(*keys)
+        except redis.exceptions.RedisError as e:
+            # Keys left behind still expire with their TTL
+            logger.exception("Failed to drop expired game keys", exc_info=e)
+    return dropped
+
+
+def expire_batch(cutoff, batch_size, archive=None):
+    """Deletes up to batch_size games inactive since cutoff with their tasks
+    and player memberships, returning counts of what was reclaimed.
+
+    Each batch is its own short transaction. Locks are taken in the order
+    completions take them, the games' tasks first and then the games, so a
+    completion in flight makes the batch skip its game instead of
+    deadlocking with it, and a game completed since it was selected no
+    longer matches once its lock is taken. Archived games are written to the
+    archive file as JSON lines of their board once they are deleted.
+    """
+    using = router.db_for_write(Game)
+    with transaction.atomic(using=using):
+        candidates = list(
+            Game.objects.using(using)
+            .filter(last_active__lt=cutoff)
+            .order_by("last_active", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not candidates:
+            return Counter()
+        tasks = Task.objects.using(using).filter(game_id__in=candidates)
+        total = Counter(tasks.values_list("game_id", flat=True))
+        locked = Counter(
+            tasks.select_for_update(skip_locked=True).values_list("game_id", flat=True)
+        )
+        games = list(
+            Game.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(
+                id__in=[
+                    game_id
+                    for game_id in candidates
+                    if locked[game_id] == total[game_id]
+                ],
+                last_active__lt=cutoff,
+            )
+            .order_by("last_active", "id")
+        )
+        if not games:
+            return Counter()
+        boards = []
+        if archive is not None:
+            for game in games:
+                board = BoardSerializer(game).data
+                board["last_active"] = game.last_active
+                boards.append(json.dumps(board, default=str) + "\n")
+        _, deleted = (
+            Game.objects.using(using)
+            .filter(id__in=[game.id for game in games])
+            .delete()
+        )
+        # Written once the delete succeeded, so a retried batch isn't archived twice
+        if boards:
+            archive.writelines(boards)
+            archive.flush()
+
+    reclaimed = Counter(
+        {
+            "games": deleted.get("game.Game", 0),
+            "tasks": deleted.get("game.Task", 0),
+            "memberships": deleted.get("game.Game_players", 0),
+        }
+    )
+    reclaimed["redis_keys"] = drop_redis_keys(games)
+    return reclaimed
@@ -0,0 +1,79 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import sentry_sdk
+
+logger = logging.getLogger("game")
+
+RESYNC = "resync"
+
+
+class TokenBucket:
+    """Allows rate events per second on average, in bursts of up to burst.
+
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class OutboundBuffer:
+    """Bounded queue of messages waiting to be written to one connection.
+
+    Messages are written in order by a single writer task, so a slow client
+    only holds up its own buffer. A message put under the key of one still
+    waiting replaces it, e.g. a newer update for the same task. When max_size
+    messages are waiting the backlog is dropped for a single resync message,
+    telling the client to refetch the board rather than fall further behind.
+    """
+
+    def __init__(self, write, max_size=100):
+        self.write = write
+        self.max_size = max_size
+        self.pending = {}
+        self.sequence = itertools.count()
+        self.writer = None
+
+    def put(self, message, key=None):
+        if key is None:
+            key = next(self.sequence)
+        if key not in self.pending and len(self.pending) >= self.max_size:
+            logger.warning(
+                f"OutboundBuffer.put(), Dropped: {len(self.pending)}, sending resync"
+            )
+            self.pending = {RESYNC: {"type": "send_resync"}}
+        self.pending.pop(key, None)
+        self.pending[key] = message
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(self.drain())
+
+    async def drain(self):
+        while self.pending:
+            message = self.pending.pop(next(iter(self.pending)))
+            try:
+                await self.write(message)
+            except Exception as e:
+                logger.exception("Failed outbound message write", exc_info=e)
+                sentry_sdk.capture_exception(e)
+
+    def close(self):
+        self.pending.clear()
+        if self.writer is not None:
+            self.writer.cancel()
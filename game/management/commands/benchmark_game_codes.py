@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from game.codes import code_allocator
+from game.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates games with Game.create_with_unique_code and reports the cost per "
+        "creation as the table fills. Data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=200000)
+        parser.add_argument("--batch", type=int, default=20000)
+        parser.add_argument("--block-size", type=int, default=code_allocator.block_size)
+
+    def handle(self, *args, **options):
+        code_allocator.block_size = options["block_size"]
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        self.stdout.write(f"{'games':>9} {'us/game':>9} {'queries/game':>13}")
+        with transaction.atomic(), connection.execute_wrapper(count):
+            created = 0
+            while created < options["games"]:
+                batch = min(options["batch"], options["games"] - created)
+                queries[0] = 0
+                start = time.perf_counter()
+                for _ in range(batch):
+                    Game.create_with_unique_code(None)
+                elapsed = time.perf_counter() - start
+                created += batch
+                self.stdout.write(
+                    f"{created:>9} {elapsed * 1e6 / batch:>9.1f} "
+                    f"{queries[0] / batch:>13.3f}"
+                )
+            transaction.set_rollback(True)
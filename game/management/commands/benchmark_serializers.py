@@ -0,0 +1,89 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from game.models import Game, Player, Task
+from game.serializers import BoardSerializer, GameSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares GameSerializer with BoardSerializer on square boards. Data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[5, 10, 25, 50])
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--players", type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'board':>7} {'drf ms':>9} {'fast ms':>9} {'speedup':>8} "
+            f"{'drf q':>6} {'fast q':>6} {'bytes':>8} identical"
+        )
+        with transaction.atomic():
+            for size in options["sizes"]:
+                game = self.create_game(size, options["players"])
+                drf_ms, drf_queries, drf_content = self.measure(
+                    options["iterations"], lambda: self.render_drf(game.id)
+                )
+                fast_ms, fast_queries, fast_content = self.measure(
+                    options["iterations"], lambda: self.render_fast(game.id)
+                )
+                self.stdout.write(
+                    f"{size:>3}x{size:<3} {drf_ms:>9.2f} {fast_ms:>9.2f} "
+                    f"{drf_ms / fast_ms:>7.1f}x {drf_queries:>6} {fast_queries:>6} "
+                    f"{len(fast_content):>8} {drf_content == fast_content}"
+                )
+            transaction.set_rollback(True)
+
+    def create_game(self, size, player_count):
+        game = Game.create_with_unique_code(f"Bench {size}")
+        players = Player.objects.bulk_create(
+            [Player(name=f"Player {i}") for i in range(player_count)]
+        )
+        game.players.add(*players)
+        completed_at = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        Task.objects.bulk_create(
+            [
+                Task(
+                    value=f"Task {row}-{col}",
+                    grid_row=row,
+                    grid_column=col,
+                    game=game,
+                    completed=(row + col) % 2 == 0,
+                    completed_by=players[(row + col) % player_count],
+                    last_updated=completed_at,
+                )
+                for row in range(size)
+                for col in range(size)
+            ]
+        )
+        return game
+
+    def render_drf(self, game_id):
+        game = (
+            Game.objects.filter(id=game_id)
+            .prefetch_related("tasks", "players")
+            .order_by("tasks__grid_column")
+            .first()
+        )
+        return JSONRenderer().render(
+            {"status": "success", "game": GameSerializer(game).data}
+        )
+
+    def render_fast(self, game_id):
+        game = Game.objects.get(id=game_id)
+        data = BoardSerializer(game).data
+        return BoardSerializer.render({"status": "success", "game": data})
+
+    def measure(self, iterations, render):
+        with CaptureQueriesContext(connection) as queries:
+            content = render()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            render()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+        return elapsed_ms, len(queries), content
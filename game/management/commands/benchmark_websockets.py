@@ -0,0 +1,299 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+
+from game import cache, consumers
+from game.models import Game, Player, Task
+from game.routing import websocket_urlpatterns
+from game.sharding import jump_hash
+
+CHANNEL_LAYERS = {
+    "memory": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "redis": {"default": settings.CHANNEL_LAYERS["default"]},
+}
+
+
+class QueryCounter:
+    """Counts queries on every database connection, including consumer threads"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates players on TaskUpdatesConsumer and reports fan-out latency, "
+        "throughput and DB/Redis operation counts. Data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=5)
+        parser.add_argument("--players", type=int, default=50)
+        parser.add_argument("--board-size", type=int, default=5)
+        parser.add_argument(
+            "--completions",
+            type=int,
+            default=None,
+            help="Completions per game, at most one per task. Defaults to every task.",
+        )
+        parser.add_argument(
+            "--reconnect-fraction",
+            type=float,
+            default=0.2,
+            help="Share of players that disconnect during a burst and reconnect.",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            default=0,
+            help="INBOUND_RATE_LIMIT for the run. Defaults to no limit.",
+        )
+        parser.add_argument("--layer", choices=CHANNEL_LAYERS, default="memory")
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.nodes = [
+            redis.StrictRedis.from_url(url, decode_responses=True)
+            for url in settings.REDIS_URLS
+        ]
+        self.queries = QueryCounter()
+        connection_created.connect(self.queries.install)
+        for connection in connections.all():
+            self.queries.install(None, connection)
+
+        # Bursts complete a game's tasks as fast as possible, well above the
+        # rate a real player can reach, so the limit is off unless asked for
+        rate_limit = consumers.INBOUND_RATE_LIMIT
+        consumers.INBOUND_RATE_LIMIT = options["rate_limit"]
+        games = self.create_games()
+        try:
+            with override_settings(CHANNEL_LAYERS=CHANNEL_LAYERS[options["layer"]]):
+                asyncio.run(self.run(games))
+        finally:
+            consumers.INBOUND_RATE_LIMIT = rate_limit
+            connection_created.disconnect(self.queries.install)
+            self.delete_games(games)
+
+    def create_games(self):
+        size = self.options["board_size"]
+        games = []
+        for i in range(self.options["games"]):
+            game = Game.create_with_unique_code(f"Websocket Bench {i}")
+            players = Player.objects.bulk_create(
+                [Player(name=f"Bench {i}-{p}") for p in range(self.options["players"])]
+            )
+            game.players.add(*players)
+            Task.objects.bulk_create(
+                [
+                    Task(value=f"{row}-{col}", grid_row=row, grid_column=col, game=game)
+                    for row in range(size)
+                    for col in range(size)
+                ]
+            )
+            games.append(
+                {
+                    "game": game,
+                    "players": players,
+                    "tasks": list(game.tasks.values_list("id", flat=True)),
+                }
+            )
+        return games
+
+    def delete_games(self, games):
+        for entry in games:
+            game = entry["game"]
+            cache.delete_board(game.code)
+            cache.r.delete(
+                cache.leaderboard_key(game.code),
+                cache.leaderboard_deltas_key(game.code),
+            )
+            node = self.nodes[jump_hash(f"game_{game.id}", len(self.nodes))]
+            node.delete(
+                f"game_{game.id}_stream",
+                f"game_{game.id}_latest",
+                f"game_{game.id}_cursors",
+                f"game_{game.id}_presence",
+            )
+            Player.objects.filter(id__in=[p.id for p in entry["players"]]).delete()
+            game.delete()
+
+    async def run(self, games):
+        self.application = URLRouter(websocket_urlpatterns)
+        redis_calls = self.redis_calls()
+        queries = self.queries.count
+
+        clients, connect_times = await self.timed_gather(
+            [
+                self.connect(entry, player)
+                for entry in games
+                for player in entry["players"]
+            ]
+        )
+        self.report("connect", connect_times)
+
+        heartbeat_times = (
+            await self.timed_gather([self.heartbeat(c) for c in clients])
+        )[1]
+        self.report("heartbeat", heartbeat_times)
+
+        start = time.perf_counter()
+        latencies, frames, replayed = await self.burst(games, clients)
+        elapsed = time.perf_counter() - start
+        self.report("fan-out", latencies)
+        self.stdout.write(
+            f"{'frames':<10} {frames} in {elapsed:.2f}s "
+            f"({frames / elapsed:.0f} msg/s), {replayed} replayed on reconnect"
+        )
+
+        await asyncio.gather(
+            *[client["communicator"].disconnect() for client in clients]
+        )
+        self.stdout.write(
+            f"{'db':<10} {self.queries.count - queries} queries\n"
+            f"{'redis':<10} {self.redis_calls() - redis_calls} commands"
+        )
+
+    async def connect(self, entry, player):
+        communicator = WebsocketCommunicator(
+            self.application, f"/game_updates/{entry['game'].id}/{player.id}/"
+        )
+        connected, _ = await communicator.connect(timeout=self.options["timeout"])
+        if not connected:
+            raise RuntimeError(f"Player {player.id} failed to connect")
+        return {"communicator": communicator, "player": player, "entry": entry}
+
+    async def heartbeat(self, client):
+        await client["communicator"].send_to(text_data="heartbeat")
+        await client["communicator"].receive_from(timeout=self.options["timeout"])
+
+    async def burst(self, games, clients):
+        """Completes tasks in every game while some players drop and reconnect"""
+        sent_at = {}
+        received = []
+        completions = self.options["completions"]
+        fraction = self.options["reconnect_fraction"]
+        reconnecting = clients[:: max(1, round(1 / fraction))] if fraction > 0 else []
+        online = [client for client in clients if client not in reconnecting]
+        await asyncio.gather(
+            *[client["communicator"].disconnect() for client in reconnecting]
+        )
+        # Cursors are stored by a task the consumer starts on disconnect
+        await asyncio.sleep(0.1)
+
+        expected = {}
+        for entry in games:
+            expected[entry["game"].id] = len(entry["tasks"][:completions])
+        readers = [
+            asyncio.create_task(
+                self.read(client, expected[client["entry"]["game"].id], received)
+            )
+            for client in online
+        ]
+
+        base = datetime.now(timezone.utc)
+        senders = []
+        for entry in games:
+            # Completions are sent by the game's online players in turn
+            game_online = [c for c in online if c["entry"] is entry]
+            for i, task_id in enumerate(entry["tasks"][:completions]):
+                player = entry["players"][i % len(entry["players"])]
+                sender = game_online[i % len(game_online)]
+                message = {
+                    "id": task_id,
+                    "completed_by": {"id": player.id},
+                    "last_updated": (base - timedelta(microseconds=i)).isoformat(),
+                }
+                sent_at[task_id] = time.perf_counter()
+                senders.append(
+                    sender["communicator"].send_to(text_data=json.dumps(message))
+                )
+        await asyncio.gather(*senders)
+        frames = sum(await asyncio.gather(*readers))
+
+        latencies = [
+            received_at - sent_at[task_id] for task_id, received_at in received
+        ]
+
+        replayed = []
+        for client in reconnecting:
+            reconnected = await self.connect(client["entry"], client["player"])
+            client["communicator"] = reconnected["communicator"]
+            replayed.append(
+                self.read(reconnected, expected[client["entry"]["game"].id], [])
+            )
+        replayed_frames = sum(await asyncio.gather(*replayed))
+        return latencies, frames, replayed_frames
+
+    async def read(self, client, expected, received):
+        """Reads until every expected task arrived, returning the frame count"""
+        frames = 0
+        seen = set()
+        while len(seen) < expected:
+            message = json.loads(
+                await client["communicator"].receive_from(
+                    timeout=self.options["timeout"]
+                )
+            )
+            frames += 1
+            received_at = time.perf_counter()
+            for task in message.get("tasks", [message.get("task")]):
+                if task["id"] not in seen:
+                    seen.add(task["id"])
+                    received.append((task["id"], received_at))
+        return frames
+
+    async def timed_gather(self, coroutines):
+        async def timed(coroutine):
+            start = time.perf_counter()
+            result = await coroutine
+            return result, time.perf_counter() - start
+
+        results = await asyncio.gather(*[timed(coroutine) for coroutine in coroutines])
+        return [result for result, _ in results], [elapsed for _, elapsed in results]
+
+    def report(self, name, seconds):
+        if not seconds:
+            return
+        ms = sorted(value * 1000 for value in seconds)
+        quantiles = statistics.quantiles(ms, n=100) if len(ms) > 1 else ms * 99
+        self.stdout.write(
+            f"{name:<10} n={len(ms):<6} p50={quantiles[49]:.2f}ms "
+            f"p95={quantiles[94]:.2f}ms p99={quantiles[98]:.2f}ms max={ms[-1]:.2f}ms"
+        )
+
+    def redis_calls(self):
+        """Commands run on every Redis server behind the board cache and shards"""
+        servers = {}
+        for client in [cache.r, *self.nodes]:
+            kwargs = client.connection_pool.connection_kwargs
+            servers.setdefault((kwargs.get("host"), kwargs.get("port")), client)
+        calls = 0
+        for client in servers.values():
+            stats = client.info("commandstats")
+            calls += sum(
+                stat["calls"] for name, stat in stats.items() if name != "cmdstat_info"
+            )
+        return calls
@@ -0,0 +1,87 @@
+import logging
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+import sentry_sdk
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.utils import timezone
+
+from game.expiry import expire_batch
+from game.models import Game
+
+logger = logging.getLogger("game")
+
+# Attempts at a batch rolled back by a deadlock or serialization failure
+BATCH_ATTEMPTS = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes games inactive for longer than --days in batches, with their "
+        "tasks, player memberships and Redis keys, and reports what was reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=float, default=float(os.getenv("GAME_EXPIRY_DAYS", 30))
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=int(os.getenv("GAME_EXPIRY_BATCH_SIZE", 100)),
+            help="Games deleted per transaction.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.1,
+            help="Seconds between batches, leaving the database to live traffic.",
+        )
+        parser.add_argument(
+            "--archive",
+            help="Append each expired game's board as a JSON line to this file.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        if options["dry_run"]:
+            expiring = Game.objects.filter(last_active__lt=cutoff).count()
+            self.stdout.write(f"{expiring} games inactive since {cutoff:%Y-%m-%d}")
+            return
+
+        archive = open(options["archive"], "a") if options["archive"] else None
+        reclaimed = Counter()
+        start = time.perf_counter()
+        try:
+            while True:
+                batch = self.expire_batch(cutoff, options, archive)
+                if not batch:
+                    break
+                reclaimed += batch
+                time.sleep(options["pause"])
+        finally:
+            if archive is not None:
+                archive.close()
+
+        self.stdout.write(
+            f"Expired {reclaimed['games']} games inactive since {cutoff:%Y-%m-%d} "
+            f"in {time.perf_counter() - start:.1f}s: {reclaimed['tasks']} tasks, "
+            f"{reclaimed['memberships']} player memberships and "
+            f"{reclaimed['redis_keys']} Redis keys"
+        )
+
+    def expire_batch(self, cutoff, options, archive):
+        """expire_batch, retried after a pause when the database rolls it back"""
+        for attempt in range(1, BATCH_ATTEMPTS + 1):
+            try:
+                return expire_batch(cutoff, options["batch_size"], archive)
+            except OperationalError as e:
+                if attempt == BATCH_ATTEMPTS:
+                    raise
+                logger.warning(f"expire_batch(), Attempt: {attempt}, rolled back: {e}")
+                sentry_sdk.capture_exception(e)
+                time.sleep(options["pause"])
@@ -0,0 +1,299 @@
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from channels.db import database_sync_to_async
+from daphne.access import AccessLogGenerator
+from daphne.server import Server
+from daphne.ws_protocol import WebSocketProtocol
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.urls import get_resolver
+from twisted.internet import reactor
+
+logger = logging.getLogger("game")
+
+# A worker exiting sooner than this after starting is respawned no faster,
+# so one that fails on startup doesn't spin
+RESPAWN_DELAY = 1
+
+
+def bind(host, port, backlog):
+    """The listening socket shared by every worker.
+
+    IPv4 only, as daphne adopts inherited descriptors as AF_INET sockets.
+    """
+    family, kind, proto, _, address = socket.getaddrinfo(
+        host,
+        port,
+        family=socket.AF_INET,
+        type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE,
+    )[0]
+    listener = socket.socket(family, kind, proto)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    listener.set_inheritable(True)
+    return listener
+
+
+def open_databases():
+    for alias in connections:
+        connection = connections[alias]
+        connection.ensure_connection()
+        if connection.settings_dict.get("OPTIONS", {}).get("pool"):
+            # Fill the pool to min_size rather than only the connection taken
+            connection.pool.wait()
+
+
+async def ping_redis():
+    from game.consumers import shards
+
+    for shard in shards:
+        await shard.ping()
+
+
+def warm_up(loop):
+    """Opens the connections and loads the code a worker's first requests
+    would otherwise wait on, on the loop it will serve from.
+
+    Database connections are opened in the thread consumers run their queries
+    in, and Redis connections are bound to the loop they are opened on.
+    """
+    import game.serializers  # noqa: F401
+    from game import cache
+
+    get_resolver().url_patterns
+    cache.r.ping()
+    loop.run_until_complete(database_sync_to_async(open_databases)())
+    loop.run_until_complete(ping_redis())
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves app.asgi from several daphne worker processes sharing one "
+        "listening socket. SIGHUP restarts the workers one at a time, SIGTERM or "
+        "SIGINT stops them gracefully."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-b", "--bind", default="0.0.0.0")
+        parser.add_argument("-p", "--port", type=int, default=8000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--backlog", type=int, default=2048)
+        parser.add_argument(
+            "--graceful-timeout",
+            type=float,
+            default=30,
+            help="Seconds a stopping worker waits for open requests and websockets.",
+        )
+        parser.add_argument(
+            "--startup-timeout",
+            type=float,
+            default=60,
+            help="Seconds a worker has to warm up before a restart is abandoned.",
+        )
+        # Passed by the master to the worker processes it starts
+        parser.add_argument("--listen-fd", type=int, help=argparse.SUPPRESS)
+        parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options["listen_fd"] is not None:
+            self.serve()
+        else:
+            self.supervise()
+
+    # Master
+
+    def supervise(self):
+        self.listener = bind(
+            self.options["bind"], self.options["port"], self.options["backlog"]
+        )
+        self.workers = {}
+        self.retiring = {}
+        self.stopping = False
+        self.signals = []
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        host, port = self.listener.getsockname()[:2]
+        logger.info(
+            f"serve(), Listening: {host}:{port}, Workers: {self.options['workers']}"
+        )
+        starting = [self.spawn() for _ in range(self.options["workers"])]
+        for worker in starting:
+            self.wait_ready(worker)
+
+        while self.workers or self.retiring:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP and not self.stopping:
+                    self.restart()
+                elif signum != signal.SIGHUP:
+                    self.stop()
+            self.reap()
+            time.sleep(0.1)
+        self.listener.close()
+
+    def spawn(self):
+        """Starts a worker in a fresh interpreter, so restarts load current code"""
+        ready_read, ready_write = os.pipe()
+        worker = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.abspath(sys.argv[0]),
+                "serve",
+                f"--listen-fd={self.listener.fileno()}",
+                f"--ready-fd={ready_write}",
+                f"--graceful-timeout={self.options['graceful_timeout']}",
+                f"--verbosity={self.options['verbosity']}",
+            ],
+            pass_fds=(self.listener.fileno(), ready_write),
+        )
+        os.close(ready_write)
+        worker.ready_fd = ready_read
+        worker.started = time.monotonic()
+        self.workers[worker.pid] = worker
+        return worker
+
+    def wait_ready(self, worker):
+        """Whether the worker warmed up and started accepting in time"""
+        readable, _, _ = select.select(
+            [worker.ready_fd], [], [], self.options["startup_timeout"]
+        )
+        ready = bool(readable) and os.read(worker.ready_fd, 1) == b"1"
+        os.close(worker.ready_fd)
+        if ready:
+            logger.info(f"serve(), Worker: {worker.pid}, ready")
+        else:
+            logger.error(f"serve(), Worker: {worker.pid}, failed to start")
+        return ready
+
+    def retire(self, worker):
+        self.workers.pop(worker.pid, None)
+        # Workers stop themselves after graceful_timeout, this is a backstop
+        worker.deadline = time.monotonic() + self.options["graceful_timeout"] + 5
+        self.retiring[worker.pid] = worker
+        worker.terminate()
+
+    def restart(self):
+        """Replaces each worker once its replacement is accepting connections"""
+        logger.info(f"restart(), Workers: {len(self.workers)}")
+        for worker in list(self.workers.values()):
+            replacement = self.spawn()
+            if not self.wait_ready(replacement):
+                logger.error("restart(), abandoned, keeping the remaining workers")
+                self.retire(replacement)
+                return
+            self.retire(worker)
+
+    def stop(self):
+        if self.stopping:
+            logger.warning("stop(), stopping workers immediately")
+            for worker in self.retiring.values():
+                worker.kill()
+            return
+        logger.info(f"stop(), Workers: {len(self.workers)}")
+        self.stopping = True
+        for worker in list(self.workers.values()):
+            self.retire(worker)
+
+    def reap(self):
+        for pid, worker in list(self.retiring.items()):
+            if worker.poll() is not None:
+                del self.retiring[pid]
+                self.process_dead(worker)
+            elif time.monotonic() > worker.deadline:
+                logger.warning(f"reap(), Worker: {pid}, killed after graceful timeout")
+                worker.kill()
+        for pid, worker in list(self.workers.items()):
+            if worker.poll() is None:
+                continue
+            del self.workers[pid]
+            self.process_dead(worker)
+            logger.error(f"reap(), Worker: {pid}, exited with {worker.returncode}")
+            if self.stopping:
+                continue
+            time.sleep(max(0, worker.started + RESPAWN_DELAY - time.monotonic()))
+            self.wait_ready(self.spawn())
+
+    def process_dead(self, worker):
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(worker.pid)
+
+    # Worker
+
+    def serve(self):
+        from app.asgi import application
+
+        loop = reactor._asyncioEventloop
+        warm_up(loop)
+
+        server = WorkerServer(
+            application,
+            endpoints=[f"fd:fileno={self.options['listen_fd']}"],
+            signal_handlers=False,
+            action_logger=(
+                AccessLogGenerator(sys.stdout)
+                if self.options["verbosity"] >= 1
+                else None
+            ),
+            ready_callable=self.ready,
+            graceful_timeout=self.options["graceful_timeout"],
+        )
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, server.drain)
+        server.run()
+        connections.close_all()
+
+    def ready(self):
+        os.write(self.options["ready_fd"], b"1")
+        os.close(self.options["ready_fd"])
+
+
+class WorkerServer(Server):
+    """Daphne server that can stop accepting and wait for its connections.
+
+    Open websockets are closed, so clients reconnect to another worker and
+    catch up from the offline queue.
+    """
+
+    def __init__(self, *args, graceful_timeout=30, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.graceful_timeout = graceful_timeout
+        self.ports = []
+        self.draining = False
+
+    def listen_success(self, port):
+        self.ports.append(port)
+        super().listen_success(port)
+
+    def drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        for port in self.ports:
+            port.stopListening()
+        for protocol in list(self.connections):
+            if (
+                isinstance(protocol, WebSocketProtocol)
+                and protocol.state == protocol.STATE_OPEN
+            ):
+                protocol.serverClose()
+        self.stop_when_idle(time.monotonic() + self.graceful_timeout)
+
+    def stop_when_idle(self, deadline):
+        if self.connections and time.monotonic() < deadline:
+            reactor.callLater(0.1, self.stop_when_idle, deadline)
+        else:
+            self.stop()
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0007_remove_game_last_updated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="version",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["game", "version"], name="task_game_version_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0008_game_version_task_version_task_task_game_version_idx"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            # One value per code: 36 ** 6 codes
+            "CREATE SEQUENCE game_code_seq MINVALUE 0 MAXVALUE 2176782335 START 0",
+            "DROP SEQUENCE game_code_seq",
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+def backfill_board_state(apps, schema_editor):
+    Game = apps.get_model("game", "Game")
+    for game in Game.objects.prefetch_related("tasks").iterator(chunk_size=500):
+        tasks = list(game.tasks.all())
+        if not tasks:
+            continue
+        rows = max(task.grid_row for task in tasks) + 1
+        columns = max(task.grid_column for task in tasks) + 1
+        cells = bytearray(-(-rows * columns // 8))
+        counts = [0] * (rows + columns + 2)
+        for task in tasks:
+            if not task.completed:
+                continue
+            cell = task.grid_row * columns + task.grid_column
+            cells[cell // 8] |= 1 << (cell % 8)
+            counts[task.grid_row] += 1
+            counts[rows + task.grid_column] += 1
+            if rows == columns and task.grid_row == task.grid_column:
+                counts[rows * 2] += 1
+            if rows == columns and task.grid_row + task.grid_column == rows - 1:
+                counts[rows * 2 + 1] += 1
+        Game.objects.filter(id=game.id).update(
+            grid_rows=rows,
+            grid_columns=columns,
+            completed_cells=bytes(cells),
+            line_counts=counts,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0009_game_code_seq"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="completed_cells",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name="game",
+            name="grid_columns",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="game",
+            name="grid_rows",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="game",
+            name="line_counts",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(),
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.RunPython(backfill_board_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:39
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0010_game_board_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="last_active",
+            field=models.DateTimeField(
+                db_default=django.db.models.functions.datetime.Now(), editable=False
+            ),
+        ),
+        # Existing games were last active when a task was last completed
+        migrations.RunSQL(
+            """
+            UPDATE game_game SET last_active = tasks.last_updated
+            FROM (
+                SELECT game_id, max(last_updated) AS last_updated
+                FROM game_task GROUP BY game_id
+            ) AS tasks
+            WHERE tasks.game_id = game_game.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["last_active"], name="game_last_active_idx"),
+        ),
+    ]
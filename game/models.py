@@ -1,10 +1,54 @@
 import logging
 
-from django.db import IntegrityError, models
-from django.utils.crypto import get_random_string
+from django.contrib.postgres.fields import ArrayField
+from django.db import models, router
+from django.db.models.functions import Now
+
+from game.codes import code_allocator
 
 logger = logging.getLogger("game")
 
+# SET clause shared by task completion statements. Marks the cells in a
+# "marked" CTE of (game_id, grid_row, grid_column) on the game aliased g: sets
+# their bits in completed_cells and adds them to the line_counts of their row,
+# column and diagonals. Cells outside the game's grid are ignored.
+MARK_CELLS_SQL = """
+    completed_cells = COALESCE((
+        SELECT string_agg(
+            set_byte(decode('00', 'hex'), 0, get_byte(g.completed_cells, i) | COALESCE(mask.bits, 0)),
+            ''::bytea ORDER BY i
+        )
+        FROM generate_series(0, length(g.completed_cells) - 1) AS i
+        LEFT JOIN (
+            SELECT (grid_row * g.grid_columns + grid_column) / 8 AS i,
+                bit_or(1 << mod(grid_row * g.grid_columns + grid_column, 8)) AS bits
+            FROM marked
+            WHERE marked.game_id = g.id
+            AND grid_row < g.grid_rows AND grid_column < g.grid_columns
+            GROUP BY 1
+        ) AS mask USING (i)
+    ), g.completed_cells),
+    line_counts = COALESCE((
+        SELECT array_agg(lines.n + COALESCE(added.n, 0) ORDER BY lines.line)
+        FROM unnest(g.line_counts) WITH ORDINALITY AS lines (n, line)
+        LEFT JOIN (
+            SELECT line, count(*) AS n
+            FROM marked, LATERAL (VALUES
+                (grid_row + 1),
+                (g.grid_rows + grid_column + 1),
+                (CASE WHEN g.grid_rows = g.grid_columns AND grid_row = grid_column
+                    THEN g.grid_rows * 2 + 1 END),
+                (CASE WHEN g.grid_rows = g.grid_columns
+                    AND grid_row + grid_column = g.grid_rows - 1
+                    THEN g.grid_rows * 2 + 2 END)
+            ) AS cell_lines (line)
+            WHERE marked.game_id = g.id
+            AND grid_row < g.grid_rows AND grid_column < g.grid_columns
+            GROUP BY line
+        ) AS added USING (line)
+    ), g.line_counts)
+"""
+
 
 class Player(models.Model):
     name = models.CharField(max_length=255)
@@ -17,26 +61,75 @@ class Game(models.Model):
     code = models.CharField(max_length=6, unique=True, editable=False, default=None)
     title = models.CharField(max_length=255)
     players = models.ManyToManyField(Player, related_name="games")
+    version = models.BigIntegerField(default=0, editable=False)
+    grid_rows = models.PositiveSmallIntegerField(default=0, editable=False)
+    grid_columns = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Bit grid_row * grid_columns + grid_column is set once that task is completed
+    completed_cells = models.BinaryField(default=bytes, editable=False)
+    # Completed task counts per row, then per column, then the two diagonals
+    line_counts = ArrayField(models.IntegerField(), default=list, editable=False)
+    # Bumped by completions and joining players, for expire_games
+    last_active = models.DateTimeField(db_default=Now(), editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_active"], name="game_last_active_idx"),
+        ]
 
     @classmethod
-    def create_with_unique_code(cls, title):
-        """Attempts to create a Game with a unique code, retrying on collision."""
-        retry = 100
-        while retry:
-            try:
-                code = get_random_string(
-                    6, allowed_chars="ABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890"
-                )
-                if not title:
-                    title = f"Game{code}"
-                return cls.objects.create(title=title, code=code)
-            except IntegrityError:
-                retry -= 1
-                if not retry:
-                    logger.error(
-                        f"Failed to generate a unique code after {100} retries"
+    def create_with_unique_code(cls, title, grid_rows=0, grid_columns=0):
+        """Creates a Game with the next code from the game code sequence.
+
+        Sequence codes never repeat, but may match a code issued before the
+        sequence existed; the insert skips those without raising, so it is
+        safe inside an enclosing transaction.
+        """
+        while True:
+            code = code_allocator.next_code()
+            games = list(
+                cls.objects.db_manager(router.db_for_write(cls)).raw(
+                    f"""
+                    INSERT INTO {cls._meta.db_table} (
+                        code, title, version,
+                        grid_rows, grid_columns, completed_cells, line_counts
                     )
-                continue
+                    VALUES (%s, %s, 0, %s, %s, %s, %s)
+                    ON CONFLICT (code) DO NOTHING
+                    RETURNING *
+                    """,
+                    [
+                        code,
+                        title or f"Game{code}",
+                        grid_rows,
+                        grid_columns,
+                        bytes(-(-grid_rows * grid_columns // 8)),
+                        [0] * (grid_rows + grid_columns + 2),
+                    ],
+                )
+            )
+            if games:
+                return games[0]
+            logger.warning(f"Game code {code} is already in use, skipping")
+
+    def lines_through(self, row, column):
+        """Yields (line, index, line_counts position, length) for a cell's lines"""
+        rows, columns = self.grid_rows, self.grid_columns
+        if not (0 <= row < rows and 0 <= column < columns):
+            return
+        yield "row", row, row, columns
+        yield "column", column, rows + column, rows
+        if rows == columns and row == column:
+            yield "diagonal", 0, rows * 2, rows
+        if rows == columns and row + column == rows - 1:
+            yield "diagonal", 1, rows * 2 + 1, rows
+
+    def completed_lines(self, row, column):
+        """Lines through a cell that are fully completed, from line_counts alone"""
+        return [
+            {"line": line, "index": index}
+            for line, index, position, length in self.lines_through(row, column)
+            if self.line_counts[position] >= length
+        ]
 
 
 class Task(models.Model):
@@ -49,6 +142,89 @@ class Task(models.Model):
         Player, null=True, blank=True, on_delete=models.SET_NULL
     )
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="tasks")
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["game", "version"], name="task_game_version_idx"),
+        ]
 
     def __str__(self):
         return f"Task {self.id} - {self.value}"
+
+    @classmethod
+    def complete(cls, task_id, player_id, last_updated):
+        """Marks a task completed by a player in a single conditional statement.
+
+        The earliest completion wins: an already completed task is only taken
+        over by a completion with an earlier last_updated. A winning completion
+        bumps the game's version and stamps it on the task, and because the game
+        row stays locked until commit, versions are committed in order. A first
+        completion also marks the cell on the game's bitmap and line counts.
+        Returns the updated Task with completed_by and game (id, code and board
+        state) populated, lines set to the lines it completed and
+        previous_completed_by_id set to the player it took the task from, or
+        None if the completion lost.
+        """
+        task_table = cls._meta.db_table
+        player_table = Player._meta.db_table
+        game_table = Game._meta.db_table
+        tasks = cls.objects.db_manager(router.db_for_write(cls)).raw(
+            f"""
+            WITH won AS (
+                SELECT id, game_id, grid_row, grid_column, completed AS was_completed,
+                    completed_by_id AS previous_completed_by_id
+                FROM {task_table}
+                WHERE id = %(task_id)s
+                AND (NOT completed OR last_updated > %(last_updated)s)
+                FOR UPDATE
+            ), marked AS (
+                SELECT game_id, grid_row, grid_column FROM won WHERE NOT was_completed
+            ), bumped AS (
+                UPDATE {game_table} AS g
+                SET version = g.version + 1, last_active = now(), {MARK_CELLS_SQL}
+                FROM won WHERE g.id = won.game_id
+                RETURNING g.id, g.code, g.version,
+                    g.grid_rows, g.grid_columns, g.line_counts,
+                    won.was_completed, won.previous_completed_by_id
+            ), updated AS (
+                UPDATE {task_table}
+                SET completed = true,
+                    completed_by_id = %(player_id)s,
+                    last_updated = %(last_updated)s,
+                    version = bumped.version
+                FROM bumped WHERE {task_table}.id = %(task_id)s
+                RETURNING {task_table}.*
+            )
+            SELECT updated.*,
+                {player_table}.name AS completed_by_name,
+                bumped.code AS game_code,
+                bumped.grid_rows AS game_grid_rows,
+                bumped.grid_columns AS game_grid_columns,
+                bumped.line_counts AS game_line_counts,
+                bumped.was_completed,
+                bumped.previous_completed_by_id
+            FROM updated
+            JOIN bumped ON bumped.id = updated.game_id
+            LEFT JOIN {player_table} ON {player_table}.id = updated.completed_by_id
+            """,
+            {"task_id": task_id, "player_id": player_id, "last_updated": last_updated},
+        )
+        for task in tasks:
+            task.completed_by = Player(
+                id=task.completed_by_id, name=task.completed_by_name
+            )
+            task.game = Game(
+                id=task.game_id,
+                code=task.game_code,
+                grid_rows=task.game_grid_rows,
+                grid_columns=task.game_grid_columns,
+                line_counts=task.game_line_counts,
+            )
+            if task.was_completed:
+                task.lines = []
+            else:
+                task.previous_completed_by_id = None
+                task.lines = task.game.completed_lines(task.grid_row, task.grid_column)
+            return task
+        return None
@@ -1,6 +1,9 @@
 import logging
 from collections import defaultdict
+from functools import cached_property
 
+import orjson
+from django.utils import timezone
 from rest_framework import serializers
 
 from game.models import Game, Player, Task
@@ -49,3 +52,120 @@ class GameSerializer(serializers.ModelSerializer):
             TaskSerializer(grouped_tasks[row], many=True).data
             for row in sorted(grouped_tasks.keys())
         ]
+
+
+def task_data(
+    id,
+    value,
+    grid_row,
+    grid_column,
+    last_updated,
+    completed,
+    completed_by_id,
+    completed_by_name,
+    game_id,
+):
+    """Builds the TaskSerializer representation of a task from its column values"""
+    if last_updated:
+        last_updated = last_updated.astimezone(timezone.get_current_timezone())
+        last_updated = last_updated.isoformat()
+        if last_updated.endswith("+00:00"):
+            last_updated = last_updated[:-6] + "Z"
+    return {
+        "id": id,
+        "value": value,
+        "grid_row": grid_row,
+        "grid_column": grid_column,
+        "last_updated": last_updated,
+        "completed": completed,
+        "completed_by": (
+            {"id": completed_by_id, "name": completed_by_name}
+            if completed_by_id is not None
+            else None
+        ),
+        "game_id": game_id,
+    }
+
+
+def serialize_task(task):
+    """TaskSerializer representation of a Task instance"""
+    completed_by = task.completed_by
+    return task_data(
+        task.id,
+        task.value,
+        task.grid_row,
+        task.grid_column,
+        task.last_updated,
+        task.completed,
+        completed_by.id if completed_by else None,
+        completed_by.name if completed_by else None,
+        task.game_id,
+    )
+
+
+def task_delta(task):
+    """Compact [id, completed_by id, last_updated epoch ms, game version] update"""
+    return [
+        task.id,
+        task.completed_by_id,
+        int(task.last_updated.timestamp() * 1000),
+        task.version,
+    ]
+
+
+class BoardSerializer:
+    """GameSerializer output built without DRF for the board hot paths.
+
+    Tasks and their completing players are read as tuples in one query, already
+    in grid order, and grouped into rows as plain dicts.
+    """
+
+    task_fields = (
+        "id",
+        "value",
+        "grid_row",
+        "grid_column",
+        "last_updated",
+        "completed",
+        "completed_by_id",
+        "completed_by__name",
+        "game_id",
+    )
+
+    def __init__(self, game):
+        self.game = game
+
+    @cached_property
+    def data(self):
+        tasks = (
+            Task.objects.filter(game=self.game)
+            .order_by("grid_row", "grid_column")
+            .values_list(*self.task_fields)
+        )
+        rows = []
+        grid_row = None
+        for task in tasks:
+            if task[2] != grid_row:
+                grid_row = task[2]
+                rows.append([])
+            rows[-1].append(task_data(*task))
+
+        return {
+            "id": self.game.id,
+            "code": self.game.code,
+            "title": self.game.title,
+            "players": [
+                {"id": id, "name": name}
+                for id, name in self.game.players.values_list("id", "name")
+            ],
+            "tasks": rows,
+        }
+
+    @staticmethod
+    def render(data):
+        """Encodes data to the same bytes as DRF's JSONRenderer"""
+        return (
+            orjson.dumps(data)
+            .replace("\u2028".encode(), b"\\u2028")
+            .replace("\u2029".encode(), b"\\u2029")
+        )
@@ -0,0 +1,34 @@
+import hashlib
+
+from channels_redis.core import RedisChannelLayer
+
+
+def jump_hash(key, buckets):
+    """Maps a key onto range(buckets) with Lamping and Veach's jump consistent hash.
+
+    Growing from n to n + 1 buckets moves only about 1 / (n + 1) of the keys,
+    all of them onto the new bucket.
+    """
+    if buckets == 1:
+        return 0
+    if isinstance(key, str):
+        key = key.encode("utf8")
+    key = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """RedisChannelLayer that places groups and channels with jump_hash.
+
+    The stock layer maps names to hosts by range, which moves most groups when
+    a host is added. Group names hash the same way as the consumer's offline
+    queue keys, so a game's fan-out and queue share a Redis node.
+    """
+
+    def consistent_hash(self, value):
+        return jump_hash(value, self.ring_size)
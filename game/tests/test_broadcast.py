@@ -0,0 +1,101 @@
+import asyncio
+
+import msgpack
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from game.broadcast import BroadcastCoalescer
+
+
+def update(task_id, version, player_id=1):
+    task = {"id": task_id, "completed": True, "completed_by": {"id": player_id}}
+    return task, [task_id, player_id, 1740830400000, version]
+
+
+class BroadcastCoalescerTest(SimpleTestCase):
+    async def subscribe(self):
+        self.layer = InMemoryChannelLayer()
+        self.channel = await self.layer.new_channel()
+        await self.layer.group_add("game_1", self.channel)
+
+    async def send(self, coalescer, *updates, group_name="game_1"):
+        for task, delta in updates:
+            await coalescer.send(self.layer, group_name, task, delta)
+
+    async def assertNoMessage(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.layer.receive(self.channel), 0.05)
+
+    async def test_disabled_sends_each_update(self):
+        """Each update is published immediately when coalescing is off"""
+        await self.subscribe()
+        coalescer = BroadcastCoalescer(enabled=False)
+        await self.send(coalescer, update(1, 1), update(2, 2))
+
+        first = await self.layer.receive(self.channel)
+        second = await self.layer.receive(self.channel)
+        self.assertEqual((first["task"]["id"], second["task"]["id"]), (1, 2))
+        self.assertEqual(msgpack.unpackb(first["delta"]), update(1, 1)[1])
+
+    async def test_window_batches_updates(self):
+        """Updates inside the window are published as one de-duplicated event"""
+        await self.subscribe()
+        coalescer = BroadcastCoalescer(enabled=True, window_ms=10)
+        await self.send(
+            coalescer, update(1, 2, player_id=2), update(2, 3), update(1, 1)
+        )
+
+        event = await self.layer.receive(self.channel)
+        self.assertEqual([task["id"] for task in event["tasks"]], [1, 2])
+        self.assertEqual(event["tasks"][0]["completed_by"]["id"], 2)
+        self.assertEqual(
+            msgpack.unpackb(event["delta"]),
+            [update(1, 2, player_id=2)[1], update(2, 3)[1]],
+        )
+        await self.assertNoMessage()
+        self.assertEqual(coalescer.pending, {})
+
+    async def test_single_update_keeps_unbatched_shape(self):
+        """A window holding one update publishes the same event as no coalescing"""
+        await self.subscribe()
+        coalescer = BroadcastCoalescer(enabled=True, window_ms=10)
+        await self.send(coalescer, update(1, 1))
+
+        event = await self.layer.receive(self.channel)
+        self.assertEqual(event, BroadcastCoalescer.event([update(1, 1)]))
+        self.assertNotIn("tasks", event)
+
+    async def test_windows_are_per_group(self):
+        """Updates for another game are not merged into this game's batch"""
+        await self.subscribe()
+        other_channel = await self.layer.new_channel()
+        await self.layer.group_add("game_2", other_channel)
+        coalescer = BroadcastCoalescer(enabled=True, window_ms=10)
+        await self.send(coalescer, update(1, 1))
+        await self.send(coalescer, update(2, 1), group_name="game_2")
+
+        event = await self.layer.receive(self.channel)
+        other_event = await self.layer.receive(other_channel)
+        self.assertEqual(event["task"]["id"], 1)
+        self.assertEqual(other_event["task"]["id"], 2)
+
+    async def test_bingo_follows_window(self):
+        """A bingo sent while a window is open is published after its task update"""
+        await self.subscribe()
+        coalescer = BroadcastCoalescer(enabled=True, window_ms=10)
+        await self.send(coalescer, update(1, 1))
+        bingo = {"type": "send_bingo", "bingo": {"task": 1}}
+        await coalescer.send_after(self.layer, "game_1", bingo, "bingo")
+
+        self.assertEqual((await self.layer.receive(self.channel))["task"]["id"], 1)
+        self.assertEqual(await self.layer.receive(self.channel), bingo)
+        self.assertEqual(coalescer.following, {})
+
+    async def test_bingo_without_window(self):
+        """A bingo is published at once when no window is open for the group"""
+        await self.subscribe()
+        coalescer = BroadcastCoalescer(enabled=True, window_ms=10)
+        bingo = {"type": "send_bingo", "bingo": {"task": 1}}
+        await coalescer.send_after(self.layer, "game_1", bingo, "bingo")
+
+        self.assertEqual(await self.layer.receive(self.channel), bingo)
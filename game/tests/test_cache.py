@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.routers import PIN_COOKIE
+from game import cache
+from game.models import Game, Player, Task
+from game.serializers import GameSerializer, TaskSerializer
+
+
+class BoardCacheTest(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(name="Test Player")
+        self.game = Game.objects.create(code="CACHE1", title="Cache Game")
+        self.game.players.add(self.player)
+        Task.objects.bulk_create(
+            [
+                Task(value=f"{row}{col}", grid_row=row, grid_column=col, game=self.game)
+                for row in range(3)
+                for col in reversed(range(3))
+            ]
+        )
+        cache.delete_board(self.game.code)
+
+    def tearDown(self):
+        cache.delete_board(self.game.code)
+
+    def serialize(self):
+        game = Game.objects.prefetch_related("tasks", "players").get(id=self.game.id)
+        return GameSerializer(game).data
+
+    def test_board_miss(self):
+        """Uncached game code returns None"""
+        self.assertIsNone(cache.get_board(self.game.code))
+
+    def test_set_and_get_board(self):
+        """Cached board is returned in the same shape as GameSerializer"""
+        board = self.serialize()
+        cache.set_board(board)
+        self.assertEqual(cache.get_board(self.game.code), board)
+
+    def test_partial_board_is_miss(self):
+        """Write-through before the board is cached does not count as a hit"""
+        task = Task.objects.filter(game=self.game).first()
+        cache.set_task(self.game.code, TaskSerializer(task).data)
+        self.assertIsNone(cache.get_board(self.game.code))
+
+    def test_write_through_not_overwritten_by_snapshot(self):
+        """Snapshot built from an older read keeps newer write-through tasks"""
+        stale_board = self.serialize()
+        task = Task.objects.get(game=self.game, grid_row=1, grid_column=1)
+        task.completed = True
+        task.completed_by = self.player
+        task.save()
+        cache.set_task(self.game.code, TaskSerializer(task).data)
+        cache.set_board(stale_board)
+
+        self.assertEqual(cache.get_board(self.game.code), self.serialize())
+
+    def test_add_player(self):
+        """Players written through appear in the cached board"""
+        cache.set_board(self.serialize())
+        player = Player.objects.create(name="Late Player")
+        cache.add_player(self.game.code, {"id": player.id, "name": player.name})
+        self.game.players.add(player)
+        self.assertEqual(cache.get_board(self.game.code), self.serialize())
+
+
+class RetrieveGameCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.player = Player.objects.create(name="Test Player")
+        self.game = Game.objects.create(code="CACHE2", title="Cache Game")
+        Task.objects.create(value="X", grid_row=0, grid_column=0, game=self.game)
+        self.url = "/game/join_game/"
+        cache.delete_board(self.game.code)
+
+    def tearDown(self):
+        cache.delete_board(self.game.code)
+
+    def test_join_populates_cache(self):
+        """First join reads the database and caches the board"""
+        data = {"code": self.game.code, "player_id": self.player.id}
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get_board(self.game.code), response.json()["game"])
+
+    def test_rejoin_served_from_cache(self):
+        """Joining again as an existing player does not touch the database"""
+        data = {"code": self.game.code, "player_id": self.player.id}
+        first = self.client.post(self.url, data, format="json")
+        with self.assertNumQueries(0):
+            second = self.client.post(self.url, data, format="json")
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.first = Player.objects.create(name="First")
+        self.second = Player.objects.create(name="Second")
+        self.game = Game.objects.create(code="LEADER", title="Leaderboard")
+        self.game.players.add(self.first, self.second)
+        self.tasks = Task.objects.bulk_create(
+            [
+                Task(value=str(col), grid_row=0, grid_column=col, game=self.game)
+                for col in range(3)
+            ]
+        )
+        self.url = f"/game/{self.game.code}/leaderboard/"
+        self.keys = [
+            cache.leaderboard_key(self.game.code),
+            cache.leaderboard_deltas_key(self.game.code),
+        ]
+        cache.r.delete(*self.keys)
+
+    def tearDown(self):
+        cache.r.delete(*self.keys)
+
+    def complete(self, task, player, seconds=0):
+        return self.score(self.write(task, player, seconds))
+
+    def write(self, task, player, seconds=0):
+        completed_at = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        return Task.complete(
+            task.id, player.id, completed_at - timedelta(seconds=seconds)
+        )
+
+    def score(self, task):
+        return cache.score_completion(
+            self.game.code,
+            task.version,
+            task.completed_by.id,
+            task.previous_completed_by_id,
+        )
+
+    def leaderboard(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (player["name"], player["completed"])
+            for player in response.json()["leaderboard"]
+        ]
+
+    def test_built_from_database_on_miss(self):
+        """Uncached leaderboard is counted from the database and cached"""
+        self.complete(self.tasks[0], self.second)
+
+        self.assertEqual(self.leaderboard(), [("Second", 1), ("First", 0)])
+        self.assertEqual(
+            cache.get_leaderboard(self.game.code), {self.first.id: 0, self.second.id: 1}
+        )
+
+    def test_completion_before_build_counted_once(self):
+        """Completions scored before the build do not create a partial leaderboard
+        and are not counted again on top of the database count"""
+        self.assertEqual(self.complete(self.tasks[0], self.first), {})
+        self.assertIsNone(cache.get_leaderboard(self.game.code))
+
+        self.assertEqual(self.leaderboard(), [("First", 1), ("Second", 0)])
+
+    def test_completion_scored_after_build_counted_once(self):
+        """A completion already in the database count is not added when scored"""
+        task = self.write(self.tasks[0], self.first)
+        self.leaderboard()
+
+        self.assertEqual(self.score(task), {})
+        self.assertEqual(cache.get_leaderboard(self.game.code)[self.first.id], 1)
+
+    def test_completion_during_build_counted(self):
+        """A completion scored while a build's count was in flight is applied by it"""
+        scores = {self.first.id: 0, self.second.id: 0}
+        self.complete(self.tasks[0], self.first)
+
+        cache.set_leaderboard(self.game.code, scores, version=0)
+
+        self.assertEqual(
+            cache.get_leaderboard(self.game.code), {self.first.id: 1, self.second.id: 0}
+        )
+        self.assertEqual(cache.r.exists(self.keys[1]), 0)
+
+    def test_miss_does_not_pin_client(self):
+        """Counting on the primary does not pin the client as a write would"""
+        with patch("app.routers.replicas", return_value=["replica0"]):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_incremental_updates(self):
+        """Cached leaderboard follows completions without counting tasks again"""
+        self.leaderboard()
+        self.assertEqual(self.complete(self.tasks[0], self.first), {self.first.id: 1})
+        self.complete(self.tasks[1], self.first)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.leaderboard(), [("First", 2), ("Second", 0)])
+
+    def test_earlier_completer_takes_over(self):
+        """Task moving to an earlier completer moves its point"""
+        self.leaderboard()
+        self.complete(self.tasks[0], self.first)
+
+        scores = self.complete(self.tasks[0], self.second, seconds=1)
+
+        self.assertEqual(scores, {self.second.id: 1, self.first.id: 0})
+        self.assertEqual(self.leaderboard(), [("Second", 1), ("First", 0)])
+
+    def test_same_player_takes_over(self):
+        """Player re-completing their own task earlier keeps the same score"""
+        self.leaderboard()
+        self.complete(self.tasks[0], self.first)
+
+        self.assertEqual(self.complete(self.tasks[0], self.first, seconds=1), {})
+        self.assertEqual(cache.get_leaderboard(self.game.code)[self.first.id], 1)
+
+    def test_unknown_game(self):
+        """Unknown game code returns 404"""
+        response = self.client.get("/game/NOGAME/leaderboard/")
+        self.assertEqual(response.status_code, 404)
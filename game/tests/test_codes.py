@@ -0,0 +1,73 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+
+from game.codes import (
+    CODE_ALPHABET,
+    CODE_SPACE,
+    code_allocator,
+    code_key,
+    encode,
+    permute,
+)
+from game.models import Game
+
+
+class CodePermutationTest(SimpleTestCase):
+    def test_permutation_is_distinct(self):
+        """Consecutive sequence values map to distinct codes within the code space"""
+        numbers = [permute(n) for n in range(20000)]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(all(0 <= n < CODE_SPACE for n in numbers))
+
+    def test_permutation_is_not_sequential(self):
+        """Neighbouring sequence values do not produce neighbouring codes"""
+        self.assertNotEqual(abs(permute(1) - permute(0)), 1)
+
+    def test_encode(self):
+        """Codes are six characters from the code alphabet"""
+        self.assertEqual(encode(0), "AAAAAA")
+        self.assertEqual(encode(CODE_SPACE - 1), "000000")
+        self.assertTrue(set(encode(permute(12345))) <= set(CODE_ALPHABET))
+
+    def test_code_key(self):
+        """Keys differ per secret and an empty secret is refused"""
+        self.assertNotEqual(code_key("first"), code_key("second"))
+        self.assertEqual(len(code_key("first")), 32)
+        for secret in ("", None):
+            with self.assertRaises(ImproperlyConfigured):
+                code_key(secret)
+
+
+class CreateWithUniqueCodeTest(TestCase):
+    def test_codes_are_unique(self):
+        """Every created game gets a different code"""
+        codes = {Game.create_with_unique_code("Game").code for _ in range(100)}
+        self.assertEqual(len(codes), 100)
+
+    def test_default_title(self):
+        """Game without a title is named after its code"""
+        game = Game.create_with_unique_code(None)
+        self.assertEqual(game.title, f"Game{game.code}")
+        self.assertEqual(Game.objects.get(id=game.id).code, game.code)
+
+    def test_single_query_within_block(self):
+        """Creating a game from a reserved block is one insert"""
+        Game.create_with_unique_code("First")
+        if not code_allocator.values:
+            Game.create_with_unique_code("Refill")
+        with self.assertNumQueries(1):
+            Game.create_with_unique_code("Second")
+
+    def test_existing_code_skipped(self):
+        """A code issued before the sequence is skipped without breaking the transaction"""
+        Game.create_with_unique_code("First")
+        if not code_allocator.values:
+            Game.create_with_unique_code("Refill")
+        taken = encode(permute(code_allocator.values[-1]))
+        Game.objects.create(code=taken, title="Legacy")
+
+        with transaction.atomic():
+            game = Game.create_with_unique_code("Next")
+            self.assertNotEqual(game.code, taken)
+            self.assertEqual(Game.objects.filter(code=taken).count(), 1)
@@ -1,12 +1,32 @@
+import asyncio
+import json
+import threading
 from unittest.mock import AsyncMock, patch
 
+import msgpack
+import psycopg
+from asgiref.sync import ThreadSensitiveContext
+from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
 from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
-from django.test import TestCase, override_settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import path
+from redis.exceptions import RedisError
 
-from game.consumers import TaskUpdatesConsumer
+from game.consumers import (
+    MSGPACK_SUBPROTOCOL,
+    TaskUpdatesConsumer,
+    heartbeat_cursor,
+    r_pools,
+    shards,
+)
+from game.flowcontrol import TokenBucket
+from game.models import Game, Player, Task
+from game.writebehind import TaskWriteBehind
+
+r = shards[0]
 
 TEST_CHANNEL_LAYERS = {
     "default": {
@@ -25,6 +45,24 @@ class TaskUpdatesConsumerTest(TestCase):
         )
         self.channel_layer = get_channel_layer()
 
+    async def clear_queues(self):
+        await r.delete(
+            "game_test_stream",
+            "game_test_latest",
+            "game_test_cursors",
+            "game_test_presence",
+        )
+        for pool in r_pools:
+            await pool.disconnect()
+
+    def offline_consumer(self, player_id="1"):
+        consumer = TaskUpdatesConsumer()
+        consumer.game_id = "test"
+        consumer.player_id = player_id
+        consumer.group_name = "game_test"
+        consumer.send = AsyncMock()
+        return consumer
+
     @patch(
         "game.consumers.TaskUpdatesConsumer.send_queued_messages",
         new_callable=AsyncMock,
@@ -41,40 +79,719 @@ class TaskUpdatesConsumerTest(TestCase):
 
     async def test_queue_disconnect(self):
         """Updating redis queue succeeds and then consumer successfully disconnects"""
-        pass
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.add_player_to_queue()
+
+        (last_id, _), *_ = await r.xrevrange("game_test_stream", count=1)
+        self.assertEqual(await r.hget("game_test_cursors", "1"), last_id)
+        await self.clear_queues()
 
-    async def test_failed_queue_disconnect(self):
+    @patch("game.consumers.sentry_sdk.capture_exception")
+    @patch.object(r, "xrevrange", side_effect=RedisError("down"))
+    async def test_failed_queue_disconnect(self, xrevrange_mock, capture_mock):
         """Updating redis queue fails and then consumer successfully disconnects"""
-        pass
+        await self.offline_consumer().add_player_to_queue()
+        capture_mock.assert_called_once()
 
-    async def test_receive_heartbeat(self):
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.add_player_to_queue",
+        new_callable=AsyncMock,
+    )
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    async def test_receive_heartbeat(self, send_queued_messages_mock, *mocks):
         """Recieving 'heartbeat' message is successfully responded to with 'thump'"""
-        pass
+        communicator = WebsocketCommunicator(self.application, "/testws/test/1")
+        await communicator.connect()
 
-    async def test_receive_task_update(self):
-        """Recieving valid task update successfully calls dependencies and sends message to group"""
-        pass
+        await communicator.send_to(text_data="heartbeat")
 
-    async def test_invalid_recieve_task_update(self):
-        """Recieving invalid task update successfully calls dependencies and no message is sent to group"""
-        pass
+        self.assertEqual(
+            json.loads(await communicator.receive_from()), {"message": "thump"}
+        )
+        self.assertIsNotNone(await r.zscore("game_test_presence", "1"))
+        await communicator.disconnect()
+        await self.clear_queues()
 
-    async def test_update_task(self):
-        """Valid task is updated and returned in format"""
-        pass
+    async def test_receive_presence(self):
+        """Recieving 'presence' message is responded to with online and offline players"""
+        consumer = self.offline_consumer()
+        await consumer.refresh_presence()
+        await self.offline_consumer("2").add_player_to_queue()
+
+        await consumer.receive("presence")
+
+        self.assertEqual(
+            self.sent(consumer), [{"presence": {"online": [1], "offline": [2]}}]
+        )
+        await self.clear_queues()
+
+    async def test_presence_uses_redis_clock(self):
+        """Presence is scored with Redis's clock, not the app server's"""
+        before = await r.time()
+
+        with patch("time.time", return_value=0):
+            await self.offline_consumer().refresh_presence()
+
+        after = await r.time()
+        score = await r.zscore("game_test_presence", "1")
+        self.assertGreaterEqual(score, before[0] * 1000 + before[1] // 1000)
+        self.assertLessEqual(score, after[0] * 1000 + after[1] // 1000)
+        await self.clear_queues()
+
+    async def test_disconnect_leaves_presence(self):
+        """Disconnected player is offline and no longer online"""
+        consumer = self.offline_consumer()
+        await consumer.refresh_presence()
+        await self.offline_consumer("2").refresh_presence()
+
+        await consumer.add_player_to_queue()
+
+        self.assertEqual(await consumer.presence(), (["2"], ["1"]))
+        await self.clear_queues()
+
+    async def test_stale_presence_evicted(self):
+        """Players whose heartbeats stopped are moved offline at their last heartbeat"""
+        await self.offline_consumer().refresh_presence()
+        await r.zadd("game_test_presence", {"2": 1000, "3": 2000})
+
+        self.assertEqual(await self.offline_consumer().presence(), (["1"], ["2", "3"]))
+        self.assertEqual(await r.hget("game_test_cursors", "3"), heartbeat_cursor(2000))
+        await self.clear_queues()
+
+    async def test_send_queued_messages_after_crash(self):
+        """Player whose socket died without disconnecting gets updates since their last heartbeat"""
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+        await asyncio.sleep(0.002)
+        await consumer.refresh_presence()
+        await asyncio.sleep(0.002)
+        await consumer.enqueue_message({"id": 2})
+
+        await consumer.send_queued_messages()
+
+        sent = [
+            json.loads(call.kwargs["text_data"])["task"]["id"]
+            for call in consumer.send.call_args_list
+        ]
+        self.assertEqual(sent, [2])
+        await self.clear_queues()
+
+    async def test_send_batched_task_update(self):
+        """Coalesced updates are sent to JSON clients as one tasks frame"""
+        consumer = self.offline_consumer()
+        consumer.send = AsyncMock()
+        tasks = [{"id": 1}, {"id": 2}]
+
+        await consumer.send_task_update({"tasks": tasks, "delta": b""})
+
+        consumer.send.assert_awaited_once_with(text_data=json.dumps({"tasks": tasks}))
+
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.update_task",
+        new_callable=AsyncMock,
+        return_value=None,
+    )
+    async def test_receive_rate_limited(self, update_task_mock):
+        """Completions over the connection's rate are dropped"""
+        consumer = self.offline_consumer()
+        consumer.inbound = TokenBucket(rate=1, burst=2)
+        frame = json.dumps({"id": 1, "completed_by": {"id": 1}})
+
+        for _ in range(3):
+            await consumer.receive(frame)
+
+        self.assertEqual(update_task_mock.await_count, 2)
+        consumer.send.assert_not_called()
+
+    @patch("game.consumers.INBOUND_RATE_POLICY", "reject")
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.update_task",
+        new_callable=AsyncMock,
+        return_value=None,
+    )
+    async def test_receive_rate_limited_reject(self, update_task_mock):
+        """Completions over the rate are rejected when configured to"""
+        consumer = self.offline_consumer()
+        consumer.inbound = TokenBucket(rate=1, burst=1)
+        frame = json.dumps({"id": 1, "completed_by": {"id": 1}})
+
+        await consumer.receive(frame)
+        await consumer.receive(frame)
+
+        update_task_mock.assert_awaited_once()
+        self.assertEqual(
+            self.sent(consumer), [{"rejected": {"id": 1, "reason": "rate_limited"}}]
+        )
+
+    async def test_dispatch_collapses_slow_client_updates(self):
+        """Updates waiting on a slow client are collapsed to the latest per task"""
+        consumer = self.offline_consumer()
+        release = asyncio.Event()
+
+        async def slow_send(**frame):
+            await release.wait()
+
+        consumer.send.side_effect = slow_send
+        for version in range(3):
+            await consumer.dispatch(
+                {"type": "send_task_update", "task": {"id": 1, "version": version}}
+            )
+            await asyncio.sleep(0)
+        release.set()
+        await consumer.outbound.writer
 
-    async def test_invalid_update_task(self):
-        """Invalid task is not updated and {} is returned"""
+        self.assertEqual(
+            [task["task"]["version"] for task in self.sent(consumer)], [0, 2]
+        )
+
+    async def test_invalid_recieve_task_update(self):
+        """Recieving invalid task update successfully calls dependencies and no message is sent to group"""
         pass
 
     async def test_failed_update_task(self):
         """Task update fails and {} is returned"""
         pass
 
+    async def test_enqueue_message(self):
+        """Each message is appended once to the game stream regardless of offline players"""
+        for player_id in ["1", "2", "3"]:
+            await self.offline_consumer(player_id).add_player_to_queue()
+        await self.offline_consumer("4").enqueue_message({"id": 1})
+
+        self.assertEqual(await r.xlen("game_test_stream"), 1)
+        await self.clear_queues()
+
     async def test_send_queued_messages(self):
         """Sending queued messages was succesful"""
-        pass
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 2})
+        await consumer.enqueue_message({"id": 3})
+
+        await consumer.send_queued_messages()
+
+        sent = [
+            json.loads(call.kwargs["text_data"])["task"]["id"]
+            for call in consumer.send.call_args_list
+        ]
+        self.assertEqual(sent, [2, 3])
+        self.assertIsNone(await r.hget("game_test_cursors", "1"))
+        await self.clear_queues()
+
+    def sent(self, consumer):
+        return [
+            json.loads(call.kwargs["text_data"])
+            for call in consumer.send.call_args_list
+        ]
+
+    async def test_enqueue_message_compacts_by_task(self):
+        """Only the latest entry for each task is kept and replayed"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1, "value": "A"})
+        await consumer.enqueue_message({"id": 2, "value": "B"})
+        await consumer.enqueue_message({"id": 1, "value": "C"})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(await r.xlen("game_test_stream"), 2)
+        self.assertEqual(
+            self.sent(consumer),
+            [{"task": {"id": 2, "value": "B"}}, {"task": {"id": 1, "value": "C"}}],
+        )
+        await self.clear_queues()
+
+    async def test_bingo_kept_after_compaction(self):
+        """A bingo is still replayed after its task entry is replaced"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1}, bingo={"task": 1})
+        await consumer.enqueue_message({"id": 1})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(
+            self.sent(consumer), [{"bingo": {"task": 1}}, {"task": {"id": 1}}]
+        )
+        await self.clear_queues()
+
+    @patch("game.consumers.OFFLINE_REPLAY_MAX", 1)
+    async def test_resync_over_replay_max(self):
+        """Player missing more entries than the cap is told to resync instead"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.enqueue_message({"id": 2})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [{"resync": True}])
+        self.assertIsNone(await r.hget("game_test_cursors", "1"))
+        await self.clear_queues()
+
+    @patch("game.consumers.OFFLINE_STREAM_MAXLEN", 2)
+    async def test_resync_after_trim(self):
+        """Player whose missed entries were trimmed is told to resync"""
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.add_player_to_queue()
+        for task_id in [2, 3, 4]:
+            await consumer.enqueue_message({"id": task_id})
 
-    async def test_failed_send_queued_messages(self):
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [{"resync": True}])
+        await self.clear_queues()
+
+    async def test_no_resync_before_stream(self):
+        """Player who left before anything was queued has nothing to catch up on"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [])
+        self.assertIsNone(await r.hget("game_test_cursors", "1"))
+        await self.clear_queues()
+
+    async def test_resync_after_stream_expired(self):
+        """Player whose cursor points into an expired stream is told to resync"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.add_player_to_queue()
+        await r.delete("game_test_stream")
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [{"resync": True}])
+        await self.clear_queues()
+
+    @patch("game.consumers.CATCH_UP_MODE", "merged")
+    async def test_send_queued_messages_merged(self):
+        """Merged catch up sends missed updates in one frame, then bingos"""
+        consumer = self.offline_consumer()
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.enqueue_message({"id": 2}, bingo={"task": 2})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(
+            self.sent(consumer),
+            [{"tasks": [{"id": 1}, {"id": 2}]}, {"bingo": {"task": 2}}],
+        )
+        await self.clear_queues()
+
+    @patch("game.consumers.OFFLINE_REPLAY_MAX", 1)
+    @patch("game.consumers.CATCH_UP_MODE", "merged")
+    async def test_send_queued_messages_merged_over_replay_max(self):
+        """Merged catch up sends the board when missed updates can't be replayed"""
+        consumer = self.offline_consumer()
+        consumer.load_board = AsyncMock(return_value={"id": 1})
+        await consumer.add_player_to_queue()
+        await consumer.enqueue_message({"id": 1})
+        await consumer.enqueue_message({"id": 2})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [{"board": {"id": 1}}])
+        await self.clear_queues()
+
+    @patch("game.consumers.CATCH_UP_MODE", "snapshot")
+    async def test_send_queued_messages_snapshot(self):
+        """Snapshot catch up sends the board on every connect instead of a replay"""
+        consumer = self.offline_consumer()
+        consumer.load_board = AsyncMock(return_value={"id": 1})
+        await consumer.enqueue_message({"id": 1})
+
+        await consumer.send_queued_messages()
+
+        self.assertEqual(self.sent(consumer), [{"board": {"id": 1}}])
+        await self.clear_queues()
+
+    async def test_offline_keys_expire(self):
+        """Every offline queue key is given a TTL"""
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+        await self.offline_consumer("2").refresh_presence()
+        await consumer.add_player_to_queue()
+
+        for key in ["stream", "latest", "cursors", "presence"]:
+            self.assertGreater(await r.ttl(f"game_test_{key}"), 0, key)
+        await self.clear_queues()
+
+    async def test_send_queued_messages_without_cursor(self):
+        """Player that never disconnected is not sent any queued messages"""
+        consumer = self.offline_consumer()
+        await consumer.enqueue_message({"id": 1})
+
+        await consumer.send_queued_messages()
+
+        consumer.send.assert_not_called()
+        await self.clear_queues()
+
+    @patch("game.consumers.sentry_sdk.capture_exception")
+    @patch.object(r, "pipeline", side_effect=RedisError("down"))
+    async def test_failed_send_queued_messages(self, pipeline_mock, capture_mock):
         """Sending queued messages failed and error was handled"""
-        pass
+        consumer = self.offline_consumer()
+        await consumer.send_queued_messages()
+        consumer.send.assert_not_called()
+        capture_mock.assert_called_once()
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class TaskUpdatesConsumerDatabaseTest(TransactionTestCase):
+    """Consumer methods run through database_sync_to_async, which closes
+    connections left inside a TestCase transaction."""
+
+    def setUp(self):
+        self.application = URLRouter(
+            [
+                path("testws/<game_id>/<player_id>", TaskUpdatesConsumer.as_asgi()),
+            ]
+        )
+
+    def offline_consumer(self):
+        consumer = TaskUpdatesConsumer()
+        consumer.group_name = "game_test"
+        return consumer
+
+    async def create_task(self):
+        game = await Game.objects.acreate(code="UPDATE", title="Update")
+        player = await Player.objects.acreate(name="Player")
+        task = await Task.objects.acreate(
+            value="X", grid_row=0, grid_column=0, game=game
+        )
+        return task, player
+
+    async def connect(self, task, player, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            self.application,
+            f"/testws/{task.game_id}/{player.id}",
+            subprotocols=subprotocols,
+        )
+        connected, subprotocol = await communicator.connect()
+        assert connected
+        return communicator, subprotocol
+
+    def completion(self, task, player):
+        return json.dumps(
+            {
+                "id": task.id,
+                "completed_by": {"id": player.id},
+                "last_updated": "2025-03-01T12:00:00Z",
+            }
+        )
+
+    @patch("game.consumers.cache.set_task")
+    async def test_update_task(self, set_task_mock):
+        """Valid task is updated and returned"""
+        task, player = await self.create_task()
+
+        updated = await self.offline_consumer().update_task(
+            task.id, player.id, "2025-03-01T12:00:00Z"
+        )
+
+        self.assertTrue(updated.completed)
+        self.assertEqual(updated.completed_by.name, "Player")
+        self.assertEqual(updated.version, 1)
+        set_task_mock.assert_called_once()
+
+    @patch("game.consumers.cache.set_task")
+    async def test_invalid_update_task(self, set_task_mock):
+        """Invalid task is not updated and None is returned"""
+        task, player = await self.create_task()
+        consumer = self.offline_consumer()
+        await consumer.update_task(task.id, player.id, "2025-03-01T12:00:00Z")
+
+        updated = await consumer.update_task(task.id, player.id, "2025-03-01T12:00:01Z")
+
+        self.assertIsNone(updated)
+        set_task_mock.assert_called_once()
+
+    @patch("game.consumers.cache.set_task")
+    async def test_commit_task(self, set_task_mock):
+        """Write-behind completion is returned and cached only after its flush,
+        with the committed version"""
+        task, player = await self.create_task()
+        consumer = self.offline_consumer()
+        consumer.game_id = task.game_id
+
+        with patch("game.consumers.write_behind", TaskWriteBehind(True, 0)):
+            updated = await consumer.commit_task(
+                task.id, player.id, "2025-03-01T12:00:00Z"
+            )
+
+        self.assertEqual(updated.version, 1)
+        set_task_mock.assert_called_once()
+        self.assertTrue((await Task.objects.aget(id=task.id)).completed)
+
+    @patch("game.consumers.cache.set_board")
+    @patch("game.consumers.cache.get_board", return_value=None)
+    async def test_load_board(self, get_board_mock, set_board_mock):
+        """Board snapshot is rebuilt from the database and cached on a miss"""
+        task, player = await self.create_task()
+        consumer = self.offline_consumer()
+        consumer.game_id = task.game_id
+
+        board = await consumer.load_board()
+
+        self.assertEqual(board["code"], "UPDATE")
+        self.assertEqual(
+            [[t["id"] for t in row] for row in board["tasks"]], [[task.id]]
+        )
+        set_board_mock.assert_called_once_with(board)
+
+    @patch("game.consumers.TaskUpdatesConsumer.enqueue_message", new_callable=AsyncMock)
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    @patch("game.consumers.cache.set_task")
+    async def test_receive_task_update(self, *mocks):
+        """Recieving valid task update successfully calls dependencies and sends message to group"""
+        task, player = await self.create_task()
+        communicator, subprotocol = await self.connect(task, player)
+
+        await communicator.send_to(text_data=self.completion(task, player))
+
+        self.assertIsNone(subprotocol)
+        self.assertEqual(
+            json.loads(await communicator.receive_from()),
+            {
+                "task": {
+                    "id": task.id,
+                    "value": "X",
+                    "grid_row": 0,
+                    "grid_column": 0,
+                    "completed": True,
+                    "completed_by": {"id": player.id, "name": "Player"},
+                    "game": task.game_id,
+                }
+            },
+        )
+        await communicator.disconnect()
+
+    @patch("game.consumers.TaskUpdatesConsumer.enqueue_message", new_callable=AsyncMock)
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    @patch("game.consumers.cache.set_task")
+    async def test_receive_task_update_msgpack(self, *mocks):
+        """Clients negotiating the MessagePack subprotocol receive binary deltas"""
+        task, player = await self.create_task()
+        json_communicator, _ = await self.connect(task, player)
+        communicator, subprotocol = await self.connect(
+            task, player, subprotocols=[MSGPACK_SUBPROTOCOL]
+        )
+
+        await json_communicator.send_to(text_data=self.completion(task, player))
+
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+        response = await communicator.receive_output()
+        self.assertEqual(
+            msgpack.unpackb(response["bytes"]),
+            [task.id, player.id, 1740830400000, 1],
+        )
+        await json_communicator.disconnect()
+        await communicator.disconnect()
+
+    @patch("game.consumers.TaskUpdatesConsumer.enqueue_message", new_callable=AsyncMock)
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    @patch("game.consumers.cache.set_task")
+    async def test_receive_task_update_msgpack_completion(self, *mocks):
+        """Clients on the MessagePack subprotocol can send binary completions"""
+        task, player = await self.create_task()
+        communicator, _ = await self.connect(
+            task, player, subprotocols=[MSGPACK_SUBPROTOCOL]
+        )
+
+        await communicator.send_to(
+            bytes_data=msgpack.packb([task.id, player.id, 1740830400000])
+        )
+
+        response = await communicator.receive_output()
+        self.assertEqual(
+            msgpack.unpackb(response["bytes"]),
+            [task.id, player.id, 1740830400000, 1],
+        )
+        await task.arefresh_from_db()
+        self.assertEqual(task.completed_by_id, player.id)
+        await communicator.disconnect()
+
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    async def test_receive_bad_binary_frame(self, send_queued_mock):
+        """Binary frames that aren't MessagePack completions close the socket"""
+        task, player = await self.create_task()
+        frames = [
+            ([], msgpack.packb([task.id, player.id, 1740830400000])),
+            ([MSGPACK_SUBPROTOCOL], b"\xc1"),
+            ([MSGPACK_SUBPROTOCOL], msgpack.packb([task.id, player.id])),
+            ([MSGPACK_SUBPROTOCOL], msgpack.packb([task.id, player.id, "soon"])),
+        ]
+        for subprotocols, frame in frames:
+            with self.subTest(frame=frame):
+                communicator, _ = await self.connect(
+                    task, player, subprotocols=subprotocols
+                )
+
+                await communicator.send_to(bytes_data=frame)
+
+                response = await communicator.receive_output()
+                self.assertEqual(response, {"type": "websocket.close", "code": 1003})
+                await communicator.wait()
+
+    @patch("game.consumers.TaskUpdatesConsumer.enqueue_message", new_callable=AsyncMock)
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    @patch("game.consumers.cache.set_task")
+    async def test_receive_bingo(self, set_task_mock, send_queued_mock, enqueue_mock):
+        """Completing a line broadcasts a bingo after the task update"""
+        game = await database_sync_to_async(Game.create_with_unique_code)("Bingo", 1, 1)
+        player = await Player.objects.acreate(name="Player")
+        task = await Task.objects.acreate(
+            value="X", grid_row=0, grid_column=0, game=game
+        )
+        communicator, _ = await self.connect(task, player)
+
+        await communicator.send_to(text_data=self.completion(task, player))
+
+        self.assertIn("task", json.loads(await communicator.receive_from()))
+        bingo = json.loads(await communicator.receive_from())["bingo"]
+        self.assertEqual(bingo["player"], {"id": player.id, "name": "Player"})
+        self.assertEqual(
+            [line["line"] for line in bingo["lines"]],
+            ["row", "column", "diagonal", "diagonal"],
+        )
+        self.assertEqual(enqueue_mock.call_args.args[2], bingo)
+        await communicator.disconnect()
+
+    @patch("game.consumers.LEADERBOARD_EVENTS", True)
+    @patch("game.consumers.TaskUpdatesConsumer.enqueue_message", new_callable=AsyncMock)
+    @patch(
+        "game.consumers.TaskUpdatesConsumer.send_queued_messages",
+        new_callable=AsyncMock,
+    )
+    @patch("game.consumers.cache.score_completion")
+    @patch("game.consumers.cache.set_task")
+    async def test_receive_leaderboard(self, set_task_mock, score_mock, *mocks):
+        """Score changes are broadcast when leaderboard events are enabled"""
+        task, player = await self.create_task()
+        score_mock.return_value = {player.id: 1}
+        communicator, _ = await self.connect(task, player)
+
+        await communicator.send_to(text_data=self.completion(task, player))
+
+        self.assertIn("task", json.loads(await communicator.receive_from()))
+        self.assertEqual(
+            json.loads(await communicator.receive_from()),
+            {"leaderboard": [{"id": player.id, "completed": 1}]},
+        )
+        score_mock.assert_called_once_with("UPDATE", 1, player.id, None)
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=TEST_CHANNEL_LAYERS)
+class TaskUpdatesConsumerPoolTest(TransactionTestCase):
+    """Concurrent updates share the bounded pool rather than a connection per thread"""
+
+    updates = 40
+    max_size = 4
+
+    def setUp(self):
+        options = connection.settings_dict["OPTIONS"]
+        if "pool" not in options:
+            self.skipTest("DB_POOL is disabled")
+        pool = options["pool"]
+        connection.close()
+        connection.close_pool()
+        options["pool"] = {**pool, "min_size": 1, "max_size": self.max_size}
+        self.addCleanup(self.restore_pool, options, pool)
+
+    def restore_pool(self, options, pool):
+        connection.close()
+        connection.close_pool()
+        options["pool"] = pool
+
+    def sample_backends(self, stop, peak, blocker_pid):
+        """Polls the test database's backend count from outside the pool"""
+        with psycopg.connect(
+            **connection.get_connection_params(), autocommit=True
+        ) as sampler:
+            while not stop.is_set():
+                (count,) = sampler.execute(
+                    "SELECT count(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() AND pid <> ALL(%s)",
+                    [[sampler.info.backend_pid, blocker_pid]],
+                ).fetchone()
+                peak[0] = max(peak[0], count)
+                stop.wait(0.005)
+
+    async def update(self, task, player):
+        # A context per update gives each its own sync thread, as daphne does
+        # for concurrent requests, which is when connections used to pile up
+        async with ThreadSensitiveContext():
+            consumer = TaskUpdatesConsumer()
+            consumer.game_id = task.game_id
+            return await consumer.update_task(
+                task.id, player.id, "2025-03-01T12:00:00Z"
+            )
+
+    async def update_all(self, tasks, players, blocker):
+        updates = asyncio.gather(
+            *(self.update(task, player) for task, player in zip(tasks, players))
+        )
+        # Every update now needs a connection and waits on the locked game row
+        await asyncio.sleep(0.5)
+        blocker.rollback()
+        return await updates
+
+    @patch("game.consumers.cache.score_completion")
+    @patch("game.consumers.cache.set_task")
+    def test_connections_bounded(self, *mocks):
+        """Many concurrent websocket updates never hold more than max_size connections"""
+        game = Game.create_with_unique_code("Pool", 1, self.updates)
+        tasks = Task.objects.bulk_create(
+            Task(value=str(i), grid_row=0, grid_column=i, game=game)
+            for i in range(self.updates)
+        )
+        players = Player.objects.bulk_create(
+            Player(name=f"Player {i}") for i in range(self.updates)
+        )
+        connection.close()
+        stop, peak = threading.Event(), [0]
+
+        with psycopg.connect(**connection.get_connection_params()) as blocker:
+            blocker.execute(
+                f"SELECT id FROM {Game._meta.db_table} WHERE id = %s FOR UPDATE",
+                [game.id],
+            )
+            sampler = threading.Thread(
+                target=self.sample_backends,
+                args=(stop, peak, blocker.info.backend_pid),
+            )
+            sampler.start()
+            # Run outside async_to_sync, which would funnel every update onto this thread
+            updated = asyncio.run(self.update_all(tasks, players, blocker))
+            stop.set()
+            sampler.join()
+
+        self.assertTrue(all(updated))
+        self.assertLessEqual(peak[0], self.max_size)
+        self.assertEqual(Task.objects.filter(completed=True).count(), self.updates)
@@ -0,0 +1,74 @@
+import logging
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from game.consumers import TaskUpdatesConsumer, r_pools, shards
+from game.diagnostics import dump_queue, log_queue
+
+r = shards[0]
+
+
+class Unformattable:
+    def __format__(self, spec):
+        raise AssertionError("formatted while logging is disabled")
+
+
+class QueueDiagnosticsTest(SimpleTestCase):
+    def setUp(self):
+        # Drop connections left by disconnect tasks of earlier tests' event loops
+        for pool in r_pools:
+            pool.reset()
+
+    async def clear_queues(self):
+        await r.delete("game_diag_stream", "game_diag_cursors", "game_diag_presence")
+        for pool in r_pools:
+            await pool.disconnect()
+
+    def test_log_queue_structured(self):
+        """Queue operations are logged with their fields attached to the record"""
+        with self.assertLogs("game.queue", logging.INFO) as logs:
+            log_queue("enqueue_message", "game_1_stream", length=3)
+
+        (record,) = logs.records
+        self.assertEqual(
+            record.getMessage(), "enqueue_message(), Key: game_1_stream, Length: 3"
+        )
+        self.assertEqual(record.queue_length, 3)
+
+    def test_log_queue_disabled(self):
+        """Nothing is formatted when INFO is disabled for game.queue"""
+        logger = logging.getLogger("game.queue")
+        with patch.object(logger, "level", logging.WARNING):
+            log_queue("enqueue_message", "game_1_stream", length=Unformattable())
+
+    async def test_dump_queue_sampled(self):
+        """Queue state is only read from Redis for sampled operations at DEBUG"""
+        await r.xadd("game_diag_stream", {"task": "{}"})
+        logger = logging.getLogger("game.queue")
+
+        with patch.object(r, "pipeline") as pipeline_mock:
+            await dump_queue(r, "game_diag", sample_rate=0)
+            await dump_queue(r, "game_diag", sample_rate=1)
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            await dump_queue(r, "game_diag", sample_rate=1)
+        await self.clear_queues()
+
+        pipeline_mock.assert_not_called()
+        self.assertIn("Length: 1", logs.output[0])
+
+    async def test_queue_logging_without_reads(self):
+        """Disconnecting logs the cursor without reading it back from Redis"""
+        consumer = TaskUpdatesConsumer()
+        consumer.player_id = "1"
+        consumer.group_name = "game_diag"
+
+        with (
+            patch.object(r, "hget") as hget_mock,
+            self.assertLogs("game.queue") as logs,
+        ):
+            await consumer.add_player_to_queue()
+        await self.clear_queues()
+
+        hget_mock.assert_not_called()
+        self.assertIn("Key: game_diag_stream, Cursor: 0-0", logs.output[0])
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest.mock import patch
+
+import psycopg
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from game import cache
+from game.expiry import expire_batch, game_keys, nodes
+from game.models import Game, Player, Task
+
+LONG_AGO = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class ExpireGamesTest(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(name="Player")
+        self.old_game = self.create_game("EXPIR1")
+        self.live_game = self.create_game("EXPIR2")
+        Game.objects.filter(id=self.old_game.id).update(last_active=LONG_AGO)
+
+        self.keys = game_keys(self.old_game)
+        for node, keys in self.keys.items():
+            for key in keys:
+                node.set(key, "1")
+
+    def tearDown(self):
+        for node, keys in self.keys.items():
+            node.delete(*keys)
+
+    def create_game(self, code):
+        game = Game.objects.create(code=code, title=code)
+        game.players.add(self.player)
+        Task.objects.bulk_create(
+            Task(value=str(column), grid_row=0, grid_column=column, game=game)
+            for column in range(3)
+        )
+        return game
+
+    def expire(self, **options):
+        stdout = StringIO()
+        call_command("expire_games", days=30, pause=0, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_expire_inactive_games(self):
+        """Inactive games are deleted with their tasks, memberships and Redis keys"""
+        output = self.expire(batch_size=1)
+
+        self.assertFalse(Game.objects.filter(id=self.old_game.id).exists())
+        self.assertFalse(Task.objects.filter(game_id=self.old_game.id).exists())
+        self.assertEqual(list(self.player.games.all()), [self.live_game])
+        self.assertEqual(Task.objects.filter(game=self.live_game).count(), 3)
+        for node, keys in self.keys.items():
+            self.assertEqual(node.exists(*keys), 0)
+        self.assertIn("Expired 1 games", output)
+        self.assertIn("3 tasks, 1 player memberships and 8 Redis keys", output)
+
+    def test_dry_run(self):
+        """A dry run only counts the games that would expire"""
+        output = self.expire(dry_run=True)
+
+        self.assertIn("1 games inactive", output)
+        self.assertTrue(Game.objects.filter(id=self.old_game.id).exists())
+
+    def test_archive(self):
+        """Expired games are archived as JSON lines of their board"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "games.jsonl")
+            self.expire(archive=path)
+            with open(path) as archive:
+                (board,) = [json.loads(line) for line in archive]
+
+        self.assertEqual(board["code"], "EXPIR1")
+        self.assertEqual(len(board["tasks"][0]), 3)
+
+    def test_completion_keeps_game_active(self):
+        """Completing a task marks its game active"""
+        task = self.old_game.tasks.first()
+        Task.complete(task.id, self.player.id, LONG_AGO)
+
+        self.expire()
+
+        self.old_game.refresh_from_db()
+        self.assertGreater(self.old_game.last_active, LONG_AGO)
+
+    def test_rolled_back_batch_retried(self):
+        """A batch rolled back by a deadlock is retried instead of aborting the run"""
+        attempts = []
+
+        def deadlock_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationalError("deadlock detected")
+            return expire_batch(*args)
+
+        with patch(
+            "game.management.commands.expire_games.expire_batch",
+            side_effect=deadlock_once,
+        ):
+            output = self.expire()
+
+        self.assertIn("Expired 1 games", output)
+        self.assertFalse(Game.objects.filter(id=self.old_game.id).exists())
+
+
+class ExpireGamesLockTest(TransactionTestCase):
+    def test_completion_in_flight_skipped(self):
+        """A game whose task is locked by a completion is skipped, not waited on"""
+        player = Player.objects.create(name="Player")
+        game = Game.objects.create(code="EXPIR3", title="Locked")
+        game.players.add(player)
+        task = Task.objects.create(value="X", grid_row=0, grid_column=0, game=game)
+        Game.objects.filter(id=game.id).update(last_active=LONG_AGO)
+
+        with psycopg.connect(**connection.get_connection_params()) as completion:
+            completion.execute(
+                f"SELECT id FROM {Task._meta.db_table} WHERE id = %s FOR UPDATE",
+                [task.id],
+            )
+            reclaimed = expire_batch(datetime.now(timezone.utc), 10)
+
+        self.assertEqual(reclaimed, {})
+        self.assertTrue(Game.objects.filter(id=game.id).exists())
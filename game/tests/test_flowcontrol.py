@@ -0,0 +1,63 @@
+import asyncio
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from game.flowcontrol import OutboundBuffer, TokenBucket
+
+
+class TokenBucketTest(SimpleTestCase):
+    @patch("game.flowcontrol.time.monotonic", return_value=100.0)
+    def test_burst_then_rate(self, monotonic_mock):
+        """A full bucket allows a burst, then refills at the rate"""
+        bucket = TokenBucket(rate=2, burst=3)
+
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+        monotonic_mock.return_value = 100.5
+        self.assertEqual([bucket.take() for _ in range(2)], [True, False])
+
+    def test_zero_rate_unlimited(self):
+        """A rate of 0 never limits"""
+        bucket = TokenBucket(rate=0, burst=1)
+        self.assertTrue(all(bucket.take() for _ in range(100)))
+
+
+class OutboundBufferTest(SimpleTestCase):
+    def setUp(self):
+        self.written = []
+        self.release = asyncio.Event()
+
+    async def write(self, message):
+        # The first write stalls like a slow client until released
+        if not self.written:
+            await self.release.wait()
+        self.written.append(message)
+
+    async def drained(self, buffer):
+        self.release.set()
+        await buffer.writer
+
+    async def test_waiting_message_replaced(self):
+        """A newer message for a key replaces the waiting one and moves behind others"""
+        buffer = OutboundBuffer(self.write)
+        buffer.put("1a", key=1)
+        await asyncio.sleep(0)
+        buffer.put("1b", key=1)
+        buffer.put("bingo")
+        buffer.put("1c", key=1)
+
+        await self.drained(buffer)
+
+        self.assertEqual(self.written, ["1a", "bingo", "1c"])
+
+    async def test_overflow_resyncs(self):
+        """A full buffer is dropped for a resync, followed by later messages"""
+        buffer = OutboundBuffer(self.write, max_size=2)
+        buffer.put("1", key=1)
+        await asyncio.sleep(0)
+        for key in [2, 3, 4]:
+            buffer.put(str(key), key=key)
+
+        await self.drained(buffer)
+
+        self.assertEqual(self.written, ["1", {"type": "send_resync"}, "4"])
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess, values
+
+from app import metrics
+
+
+class MetricsTest(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics_endpoint(self):
+        """Metrics are exposed in the Prometheus text format"""
+        response = self.client.get("/metrics/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"bingo_update_task_seconds_bucket", response.content)
+        self.assertIn(b"bingo_replay_entries_bucket", response.content)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        """A configured token is required to scrape metrics"""
+        self.assertEqual(self.client.get("/metrics/").status_code, 401)
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    def test_request_latency_by_view(self):
+        """REST requests are timed under their view name and status"""
+        labels = {"view": "game_leaderboard", "method": "GET", "status": "404"}
+        before = self.sample("bingo_http_request_seconds_count", **labels)
+
+        self.client.get("/game/NOGAME/leaderboard/")
+
+        self.assertEqual(
+            self.sample("bingo_http_request_seconds_count", **labels), before + 1
+        )
+
+    def test_connection_gauge_removed(self):
+        """A game's connection series is removed with its last connection"""
+        metrics.connection_opened("42")
+        metrics.connection_opened("42")
+        metrics.offline_queue_length.labels("42").set(3)
+        metrics.connection_closed("42")
+        self.assertEqual(self.sample("bingo_websocket_connections", game="42"), 1)
+
+        metrics.connection_closed("42")
+
+        self.assertIsNone(
+            REGISTRY.get_sample_value("bingo_websocket_connections", {"game": "42"})
+        )
+        self.assertIsNone(
+            REGISTRY.get_sample_value("bingo_offline_queue_length", {"game": "42"})
+        )
+
+    def test_connection_gauge_zeroed_multiprocess(self):
+        """With worker processes sharing metric files, a game's series are zeroed
+        when its last connection closes"""
+        self.addCleanup(metrics.websocket_connections.remove, "43")
+        self.addCleanup(metrics.offline_queue_length.remove, "43")
+        with (
+            tempfile.TemporaryDirectory() as path,
+            patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": path}),
+            patch("prometheus_client.values.ValueClass", values.MultiProcessValue()),
+        ):
+            metrics.connection_opened("43")
+            metrics.offline_queue_length.labels("43").set(3)
+            metrics.connection_closed("43")
+
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=path)
+            for name in ("bingo_websocket_connections", "bingo_offline_queue_length"):
+                self.assertEqual(registry.get_sample_value(name, {"game": "43"}), 0)
+
+    @skipUnless(settings.DB_POOL, "DB_POOL is disabled")
+    def test_database_pool_usage(self):
+        """Pool usage is reported for each pooled database"""
+        families = {
+            family.name: family for family in metrics.DatabasePoolCollector().collect()
+        }
+
+        self.assertIn(
+            {"db": "default"},
+            [sample.labels for sample in families["bingo_db_pool_connections"].samples],
+        )
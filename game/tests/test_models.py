@@ -0,0 +1,214 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from game.models import Game, Player, Task
+
+
+def completed_positions(game):
+    """(grid_row, grid_column) of every completed cell, read from the game's bitmap"""
+    cells = bytes(game.completed_cells)
+    return [
+        divmod(cell, game.grid_columns)
+        for cell in range(game.grid_rows * game.grid_columns)
+        if cells[cell // 8] >> (cell % 8) & 1
+    ]
+
+
+COMPLETED_AT = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TaskCompleteTest(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(code="CMPLT1", title="Complete")
+        self.player = Player.objects.create(name="First")
+        self.other_player = Player.objects.create(name="Second")
+        self.task = Task.objects.create(
+            value="X", grid_row=0, grid_column=0, game=self.game
+        )
+
+    def test_complete_task(self):
+        """Incomplete task is completed and returned with player and game"""
+        with self.assertNumQueries(1):
+            task = Task.complete(self.task.id, self.player.id, COMPLETED_AT)
+
+        self.assertTrue(task.completed)
+        self.assertIsNone(task.previous_completed_by_id)
+        self.assertEqual(task.last_updated, COMPLETED_AT)
+        self.assertEqual(task.completed_by.name, self.player.name)
+        self.assertEqual(task.game.code, self.game.code)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.completed_by, self.player)
+
+    def test_earlier_completion_wins(self):
+        """Completed task is taken over by an earlier completion"""
+        Task.complete(self.task.id, self.player.id, COMPLETED_AT)
+        earlier = COMPLETED_AT - timedelta(seconds=1)
+
+        task = Task.complete(self.task.id, self.other_player.id, earlier)
+
+        self.assertEqual(task.completed_by.id, self.other_player.id)
+        self.assertEqual(task.previous_completed_by_id, self.player.id)
+        self.assertEqual(task.last_updated, earlier)
+
+    def test_later_completion_loses(self):
+        """Completed task is not taken over by a later completion"""
+        Task.complete(self.task.id, self.player.id, COMPLETED_AT)
+        later = COMPLETED_AT + timedelta(seconds=1)
+
+        self.assertIsNone(Task.complete(self.task.id, self.other_player.id, later))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.completed_by, self.player)
+
+    def test_completion_versions(self):
+        """Winning completions stamp the task with the next game version"""
+        other_task = Task.objects.create(
+            value="O", grid_row=0, grid_column=1, game=self.game
+        )
+        first = Task.complete(self.task.id, self.player.id, COMPLETED_AT)
+        second = Task.complete(other_task.id, self.player.id, COMPLETED_AT)
+        Task.complete(self.task.id, self.player.id, COMPLETED_AT)
+
+        self.assertEqual((first.version, second.version), (1, 2))
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.version, 2)
+
+    def test_missing_task(self):
+        """Unknown task id completes nothing"""
+        self.assertIsNone(Task.complete(0, self.player.id, COMPLETED_AT))
+
+
+class TaskCompleteConcurrencyTest(TransactionTestCase):
+    workers = 16
+
+    def setUp(self):
+        self.game = Game.objects.create(code="RACE01", title="Race")
+        self.players = [
+            Player.objects.create(name=f"Player{i}") for i in range(self.workers)
+        ]
+        self.task = Task.objects.create(
+            value="X", grid_row=0, grid_column=0, game=self.game
+        )
+
+    def race(self, completions):
+        barrier = threading.Barrier(len(completions))
+
+        def complete(args):
+            player, last_updated = args
+            try:
+                barrier.wait()
+                return Task.complete(self.task.id, player.id, last_updated)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(completions)) as executor:
+            return list(executor.map(complete, completions))
+
+    def test_simultaneous_completions(self):
+        """Only one of many identical completions wins the task"""
+        results = self.race([(player, COMPLETED_AT) for player in self.players])
+
+        winners = [task for task in results if task]
+        self.assertEqual(len(winners), 1)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.completed_by_id, winners[0].completed_by.id)
+
+    def test_earliest_completion_wins_race(self):
+        """Earliest of many racing completions is the final state"""
+        completions = [
+            (player, COMPLETED_AT + timedelta(seconds=i))
+            for i, player in enumerate(self.players)
+        ]
+        results = self.race(list(reversed(completions)))
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.completed_by, self.players[0])
+        self.assertEqual(self.task.last_updated, COMPLETED_AT)
+        winners = [task for task in results if task]
+        self.assertIn(self.players[0].id, [task.completed_by.id for task in winners])
+
+
+class BoardStateTest(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(name="First")
+        self.other_player = Player.objects.create(name="Second")
+        self.game = self.create_game(3, 3)
+
+    def create_game(self, rows, columns):
+        game = Game.create_with_unique_code("Board", rows, columns)
+        Task.objects.bulk_create(
+            [
+                Task(value=f"{row}{col}", grid_row=row, grid_column=col, game=game)
+                for row in range(rows)
+                for col in range(columns)
+            ]
+        )
+        return game
+
+    def complete(self, row, column, game=None, player=None, last_updated=None):
+        task = Task.objects.get(
+            game=game or self.game, grid_row=row, grid_column=column
+        )
+        return Task.complete(
+            task.id, (player or self.player).id, last_updated or COMPLETED_AT
+        )
+
+    def test_completed_cells_bitmap(self):
+        """Completed cells are read back from the game's bitmap"""
+        for row, column in [(2, 1), (0, 2)]:
+            self.complete(row, column)
+
+        self.game.refresh_from_db()
+        self.assertEqual(completed_positions(self.game), [(0, 2), (2, 1)])
+        self.assertEqual(self.game.line_counts, [1, 0, 1, 0, 1, 1, 0, 1])
+
+    def test_row_completion(self):
+        """Only the completion that fills a row reports it"""
+        lines = [self.complete(0, column).lines for column in range(3)]
+        self.assertEqual(lines, [[], [], [{"line": "row", "index": 0}]])
+
+    def test_column_and_diagonals(self):
+        """Centre cell completes its column and both diagonals at once"""
+        for row, column in [(0, 1), (2, 1), (0, 0), (2, 2), (0, 2), (2, 0)]:
+            self.complete(row, column)
+
+        self.assertEqual(
+            self.complete(1, 1).lines,
+            [
+                {"line": "column", "index": 1},
+                {"line": "diagonal", "index": 0},
+                {"line": "diagonal", "index": 1},
+            ],
+        )
+
+    def test_takeover_not_counted_twice(self):
+        """Earlier completion taking over a cell does not mark it again"""
+        self.complete(0, 0)
+        earlier = COMPLETED_AT - timedelta(seconds=1)
+        task = self.complete(0, 0, player=self.other_player, last_updated=earlier)
+
+        self.assertEqual(task.lines, [])
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.line_counts, [1, 0, 0, 1, 0, 0, 1, 0])
+
+    def test_rectangular_board_has_no_diagonals(self):
+        """Diagonals are only tracked on square boards"""
+        game = self.create_game(2, 3)
+        self.complete(0, 0, game=game)
+        self.complete(1, 0, game=game)
+
+        game.refresh_from_db()
+        self.assertEqual(game.line_counts, [1, 1, 2, 0, 0, 0, 0])
+        self.assertEqual(completed_positions(game), [(0, 0), (1, 0)])
+
+    def test_game_without_grid(self):
+        """Games created without a grid complete tasks without tracking lines"""
+        game = Game.objects.create(code="NOGRID", title="No Grid")
+        task = Task.objects.create(value="X", grid_row=0, grid_column=0, game=game)
+
+        self.assertEqual(Task.complete(task.id, self.player.id, COMPLETED_AT).lines, [])
+        game.refresh_from_db()
+        self.assertEqual((bytes(game.completed_cells), game.line_counts), (b"", []))
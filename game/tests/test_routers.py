@@ -0,0 +1,108 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from app.routers import (
+    PIN_COOKIE,
+    ReplicaPinningMiddleware,
+    pin_primary,
+    primary_pinned,
+)
+from game.models import Game, Player
+
+
+@patch("app.routers.replicas", return_value=["replica0"])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        # Writes outside a request, e.g. by other tests, pin the whole thread
+        self.token = primary_pinned.set(False)
+
+    def tearDown(self):
+        primary_pinned.reset(self.token)
+
+    def request(self, view, cookies=None):
+        request = RequestFactory().post("/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinningMiddleware(view)(request)
+
+    def test_game_reads_go_to_replica(self, replicas_mock):
+        """Game app reads are routed to a replica and writes to the primary"""
+        self.assertEqual(self.request(lambda request: HttpResponse()).cookies, {})
+
+        def view(request):
+            self.assertEqual(router.db_for_read(Game), "replica0")
+            self.assertEqual(router.db_for_read(Session), "default")
+            return HttpResponse()
+
+        self.request(view)
+
+    def test_reads_after_write_pinned(self, replicas_mock):
+        """A write pins the rest of the request and the client to the primary"""
+
+        def view(request):
+            self.assertEqual(router.db_for_write(Player), "default")
+            self.assertEqual(router.db_for_read(Game), "default")
+            return HttpResponse()
+
+        response = self.request(view)
+
+        self.assertEqual(
+            response.cookies[PIN_COOKIE]["max-age"], settings.REPLICA_PIN_SECONDS
+        )
+        self.assertEqual(router.db_for_read(Game), "replica0")
+
+    def test_pin_cookie_reads_primary(self, replicas_mock):
+        """Client pinned by an earlier write reads from the primary"""
+
+        def view(request):
+            self.assertEqual(router.db_for_read(Game), "default")
+            return HttpResponse()
+
+        response = self.request(view, {PIN_COOKIE: "1"})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_pin_primary(self, replicas_mock):
+        """pin_primary reads from the primary only inside the block"""
+        with pin_primary():
+            self.assertEqual(router.db_for_read(Game), "default")
+        self.assertEqual(router.db_for_read(Game), "replica0")
+
+    def test_instance_database_followed(self, replicas_mock):
+        """Related lookups stay on the database their instance came from"""
+        game = Game(id=1)
+        game._state.db = "default"
+        self.assertEqual(router.db_for_read(Game, instance=game), "default")
+
+
+@skipUnless("replica0" in settings.DATABASES, "DATABASE_REPLICA_URLS is not set")
+class ReplicaRoutingIntegrationTest(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.player = Player.objects.create(name="Player")
+        self.url = "/game/join_game/"
+
+    def join(self, **cookies):
+        self.client.cookies.clear()
+        for name, value in cookies.items():
+            self.client.cookies[name] = value
+        data = {"code": "NOGAME", "player_id": self.player.id}
+        with CaptureQueriesContext(connections["replica0"]) as replica_queries:
+            self.client.post(self.url, data, format="json")
+        return len(replica_queries)
+
+    def test_join_reads_replica(self):
+        """Game lookup on join runs against the replica"""
+        self.assertEqual(self.join(), 1)
+
+    def test_pinned_join_reads_primary(self):
+        """Pinned client's join does not touch the replica"""
+        self.assertEqual(self.join(**{PIN_COOKIE: "1"}), 0)
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from game.models import Game, Player, Task
+from game.serializers import (
+    BoardSerializer,
+    GameSerializer,
+    TaskSerializer,
+    serialize_task,
+)
+
+
+class BoardSerializerTest(TestCase):
+    def setUp(self):
+        self.player = Player.objects.create(name="Zoë")
+        self.other_player = Player.objects.create(name="Second")
+        self.game = Game.objects.create(code="FAST01", title="Fast   Game")
+        self.game.players.add(self.player, self.other_player)
+        values = ["plain", "ünïcode", "new\nline", 'quote "', "sep  ", "✓"]
+        Task.objects.bulk_create(
+            [
+                Task(
+                    value=values[(row * 4 + col) % len(values)],
+                    grid_row=row,
+                    grid_column=col,
+                    game=self.game,
+                )
+                for row in reversed(range(4))
+                for col in reversed(range(4))
+            ]
+        )
+        Task.complete(
+            Task.objects.get(game=self.game, grid_row=1, grid_column=2).id,
+            self.player.id,
+            datetime(2025, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc),
+        )
+
+    def drf_render(self):
+        game = Game.objects.prefetch_related("tasks", "players").get(id=self.game.id)
+        return JSONRenderer().render(GameSerializer(game).data)
+
+    def test_byte_identical_to_game_serializer(self):
+        """Rendered board is byte-identical to the DRF GameSerializer response"""
+        data = BoardSerializer(self.game).data
+        self.assertEqual(BoardSerializer.render(data), self.drf_render())
+
+    def test_board_queries(self):
+        """Board is built with one query for tasks and one for players"""
+        with self.assertNumQueries(2):
+            BoardSerializer(self.game).data
+
+    def test_serialize_task(self):
+        """Single task matches TaskSerializer"""
+        for task in Task.objects.filter(game=self.game).select_related("completed_by"):
+            self.assertEqual(serialize_task(task), TaskSerializer(task).data)
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import TransactionTestCase
+
+from game.consumers import r_pools
+from game.management.commands.serve import bind, warm_up
+
+
+class ServeTest(TransactionTestCase):
+    databases = "__all__"
+
+    def test_warm_up(self):
+        """Workers connect to the database from the consumers' thread and to
+        Redis on the loop they serve from before accepting"""
+        threads = []
+
+        def connected(sender, connection, **kwargs):
+            threads.append(threading.get_ident())
+
+        loop = asyncio.new_event_loop()
+        for pool in r_pools:
+            pool.reset()
+        connection_created.connect(connected)
+        try:
+            warm_up(loop)
+        finally:
+            connection_created.disconnect(connected)
+            ready = [bool(pool._available_connections) for pool in r_pools]
+            # Replicas mirror the test database but aren't torn down with it
+            loop.run_until_complete(sync_to_async(connections.close_all)())
+            for alias in connections:
+                pooled = connections.settings[alias]["OPTIONS"].get("pool")
+                if alias != "default" and pooled:
+                    connections[alias].close_pool()
+            for pool in r_pools:
+                loop.run_until_complete(pool.disconnect())
+            loop.close()
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(ready, [True] * len(r_pools))
+
+    def test_bind(self):
+        """The listening socket is kept open across exec for the workers"""
+        listener = bind("127.0.0.1", 0, backlog=8)
+        try:
+            self.assertTrue(listener.get_inheritable())
+            self.assertNotEqual(listener.getsockname()[1], 0)
+        finally:
+            listener.close()
@@ -0,0 +1,87 @@
+import os
+from unittest.mock import patch
+from urllib.parse import urlsplit, urlunsplit
+
+import redis
+import redis.asyncio as aredis
+from django.test import SimpleTestCase
+
+from game.consumers import TaskUpdatesConsumer
+from game.sharding import ShardedRedisChannelLayer, jump_hash
+
+
+def stand_in_urls(count):
+    """Separate databases of the test Redis standing in for separate nodes"""
+    url = urlsplit(os.getenv("REDIS_URL"))
+    return [urlunsplit(url._replace(path=f"/{db}")) for db in range(1, count + 1)]
+
+
+class JumpHashTest(SimpleTestCase):
+    keys = [f"game_{i}" for i in range(2000)]
+
+    def test_buckets_in_range(self):
+        """Every key maps to a valid bucket and a single bucket is always 0"""
+        for buckets in range(1, 8):
+            for key in self.keys[:200]:
+                self.assertIn(jump_hash(key, buckets), range(buckets))
+        self.assertEqual(jump_hash("game_1", 1), 0)
+
+    def test_adding_bucket_moves_few_keys(self):
+        """Growing 4 to 5 buckets only moves keys, about a fifth, onto the new bucket"""
+        moved = [key for key in self.keys if jump_hash(key, 4) != jump_hash(key, 5)]
+
+        self.assertLess(abs(len(moved) / len(self.keys) - 1 / 5), 0.05)
+        self.assertTrue(all(jump_hash(key, 5) == 4 for key in moved))
+
+    def test_str_and_bytes_agree(self):
+        """Channel layer byte names hash like the consumer's string keys"""
+        self.assertEqual(jump_hash("game_7", 5), jump_hash(b"game_7", 5))
+
+
+class ShardedRedisTest(SimpleTestCase):
+    nodes = 3
+
+    def setUp(self):
+        self.urls = stand_in_urls(self.nodes)
+        self.clients = [redis.StrictRedis.from_url(url) for url in self.urls]
+
+    def tearDown(self):
+        for client in self.clients:
+            client.flushdb()
+            client.close()
+
+    def holders(self, key):
+        return [i for i, client in enumerate(self.clients) if client.exists(key)]
+
+    async def test_group_placed_by_jump_hash(self):
+        """Group membership lives only on the group's node and messages still fan out"""
+        layer = ShardedRedisChannelLayer(hosts=[{"address": url} for url in self.urls])
+        channels = [await layer.new_channel() for _ in range(4)]
+        for channel in channels:
+            await layer.group_add("game_42", channel)
+
+        await layer.group_send("game_42", {"type": "send_task_update", "task": {}})
+
+        for channel in channels:
+            self.assertEqual((await layer.receive(channel))["type"], "send_task_update")
+        self.assertEqual(
+            self.holders("asgi:group:game_42"), [jump_hash("game_42", self.nodes)]
+        )
+        await layer.close_pools()
+
+    async def test_offline_queue_shares_group_node(self):
+        """Consumer queue keys are written to the same node as the game's group"""
+        pools = [aredis.ConnectionPool.from_url(url) for url in self.urls]
+        shards = [aredis.StrictRedis.from_pool(pool) for pool in pools]
+        consumer = TaskUpdatesConsumer()
+        consumer.game_id = "42"
+        consumer.group_name = "game_42"
+
+        with patch("game.consumers.shards", shards):
+            await consumer.enqueue_message({"id": 1})
+
+        self.assertEqual(
+            self.holders("game_42_stream"), [jump_hash("game_42", self.nodes)]
+        )
+        for pool in pools:
+            await pool.disconnect()
@@ -0,0 +1,96 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+
+from app.tracing import StackProfiler, TraceSampler, parse_rates, sampler, traced
+
+
+class TraceSamplerTest(SimpleTestCase):
+    def setUp(self):
+        self.sampler = TraceSampler(
+            0.1, {"game_leaderboard": 0.5}, slow_ms=100, boost_seconds=60
+        )
+
+    def context(self, path=None, name="generic"):
+        context = {"transaction_context": {"name": name}}
+        if path:
+            context["asgi_scope"] = {"type": "http", "path": path}
+        return context
+
+    def test_rates_by_name(self):
+        """Requests are sampled at their url name's rate, or the default"""
+        self.assertEqual(self.sampler(self.context("/game/ABC123/leaderboard/")), 0.5)
+        self.assertEqual(self.sampler(self.context("/game/join_game/")), 0.1)
+        self.assertEqual(self.sampler(self.context(name="websocket.catch_up")), 0.1)
+
+    def test_parent_decision_kept(self):
+        """A trace continued from an upstream service keeps its decision"""
+        context = self.context("/game/join_game/")
+        context["parent_sampled"] = True
+        self.assertTrue(self.sampler(context))
+
+    def test_slow_or_failed_boosts(self):
+        """A slow or failed request has its name sampled in full"""
+        self.sampler.record("game_leaderboard", 0.01)
+        self.sampler.record("websocket.catch_up", 0.2)
+        self.sampler.record("join_game", 0.01, failed=True)
+
+        self.assertEqual(self.sampler.rate("game_leaderboard"), 0.5)
+        self.assertEqual(self.sampler.rate("websocket.catch_up"), 1.0)
+        self.assertEqual(self.sampler.rate("join_game"), 1.0)
+
+    def test_parse_rates(self):
+        """Overrides are read from comma separated name=rate pairs"""
+        self.assertEqual(
+            parse_rates("game_leaderboard=0.5, websocket.catch_up=0"),
+            {"game_leaderboard": 0.5, "websocket.catch_up": 0.0},
+        )
+        self.assertEqual(parse_rates(""), {})
+
+    @patch.object(sampler, "boosted", {})
+    async def test_traced_failure_boosts(self):
+        """A websocket handler raising has its name sampled in full"""
+
+        @traced("websocket.test")
+        async def handler():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            await handler()
+
+        self.assertEqual(sampler.rate("websocket.test"), 1.0)
+
+
+class TracingMiddlewareTest(TestCase):
+    @patch.object(sampler, "boosted", {})
+    @patch("game.views.cache.get_leaderboard", side_effect=Exception("down"))
+    def test_failed_request_boosts(self, get_leaderboard_mock):
+        """A REST request failing has its view sampled in full"""
+        self.client.get("/game/ABC123/leaderboard/")
+
+        self.assertEqual(sampler.rate("game_leaderboard"), 1.0)
+
+
+class StackProfilerTest(SimpleTestCase):
+    def test_sample_busy_thread(self):
+        """The hot function of the profiled thread shows up in its stacks"""
+        done = threading.Event()
+
+        def busy_loop():
+            while not done.is_set():
+                sum(range(1000))
+
+        thread = threading.Thread(target=busy_loop)
+        thread.start()
+        try:
+            stacks = StackProfiler(thread.ident, interval_ms=1).sample(0.05)
+        finally:
+            done.set()
+            thread.join()
+
+        (stack, _), *_ = stacks.most_common(1)
+        self.assertIn("test_tracing.py:busy_loop", stack)
+        self.assertTrue(stack.startswith("threading.py:_bootstrap"))
+        self.assertIn("busy_loop", StackProfiler.report(stacks))
@@ -1,8 +1,10 @@
+from datetime import datetime, timezone
+
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from game.models import Game, Player
+from game.models import Game, Player, Task
 from game.serializers import GameSerializer
 
 
@@ -82,3 +84,56 @@ class RetrieveGameTestCase(TestCase):
     def test_game_retrieval_error(self):
         """Game retrieval resulted in a error and 500 sent back to client"""
         pass
+
+
+class RetrieveGameChangesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.player = Player.objects.create(name="Player")
+        self.game = Game.objects.create(code="DELTA1", title="Delta")
+        self.tasks = Task.objects.bulk_create(
+            [
+                Task(value=str(col), grid_row=0, grid_column=col, game=self.game)
+                for col in range(3)
+            ]
+        )
+        self.url = f"/game/{self.game.code}/changes/"
+
+    def complete(self, task):
+        Task.complete(
+            task.id, self.player.id, datetime(2025, 3, 1, tzinfo=timezone.utc)
+        )
+
+    def test_changes_since_version(self):
+        """Only tasks changed after the watermark are returned with the new version"""
+        self.complete(self.tasks[0])
+        version = self.client.get(self.url).json()["version"]
+        self.complete(self.tasks[2])
+
+        response = self.client.get(self.url, {"since": version})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["version"], version + 1)
+        self.assertEqual(
+            [task["id"] for task in response.json()["tasks"]], [self.tasks[2].id]
+        )
+
+    def test_no_changes(self):
+        """Up to date watermark returns no tasks"""
+        self.complete(self.tasks[0])
+        version = self.client.get(self.url).json()["version"]
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"since": version})
+
+        self.assertEqual(response.json()["tasks"], [])
+
+    def test_invalid_since(self):
+        """Non-integer watermark is rejected with 400"""
+        response = self.client.get(self.url, {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_game_not_found(self):
+        """Unknown game code returns 404"""
+        response = self.client.get("/game/NOGAME/changes/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
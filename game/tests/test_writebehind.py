@@ -0,0 +1,198 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from channels.db import database_sync_to_async
+from django.test import TestCase, TransactionTestCase
+
+from game.models import Game, Player, Task
+from game.tests.test_models import completed_positions
+from game.writebehind import TaskWriteBehind
+
+COMPLETED_AT = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class WriteBehindGame:
+    def setUp(self):
+        self.write_behind = TaskWriteBehind(enabled=True)
+        self.player = Player.objects.create(name="First")
+        self.other_player = Player.objects.create(name="Second")
+        self.game = Game.create_with_unique_code("Write Behind", 1, 5)
+        self.game.players.add(self.player)
+        self.tasks = Task.objects.bulk_create(
+            [
+                Task(value=str(col), grid_row=0, grid_column=col, game=self.game)
+                for col in range(5)
+            ]
+        )
+
+    def complete(self, task, player, last_updated=COMPLETED_AT):
+        return self.write_behind.complete(
+            str(self.game.id), task.id, player.id, last_updated
+        )
+
+
+class TaskWriteBehindTest(WriteBehindGame, TestCase):
+    def test_completion_queued(self):
+        """Completion is queued for the flush without writing to the database"""
+        sequence = self.complete(self.tasks[0], self.player)
+
+        self.assertEqual(sequence, 1)
+        self.assertTrue(self.write_behind.pending[self.tasks[0].id][1].completed)
+        self.assertFalse(Task.objects.get(id=self.tasks[0].id).completed)
+
+    def test_board_loaded_once(self):
+        """Completions after the first do not query the database"""
+        self.complete(self.tasks[0], self.player)
+        with self.assertNumQueries(0):
+            for task in self.tasks[1:]:
+                self.complete(task, self.player)
+
+    def test_later_completion_loses(self):
+        """Pending completion is not taken over by a later completion"""
+        self.complete(self.tasks[0], self.player)
+        later = COMPLETED_AT + timedelta(seconds=1)
+        self.assertIsNone(self.complete(self.tasks[0], self.other_player, later))
+
+    def test_task_from_other_game(self):
+        """Task that is not on the game's board is not completed"""
+        other_game = Game.objects.create(code="OTHER1", title="Other")
+        task = Task.objects.create(
+            value="X", grid_row=0, grid_column=0, game=other_game
+        )
+        self.assertIsNone(self.complete(task, self.player))
+
+    def test_flush(self):
+        """Flushing writes every pending completion in one query"""
+        sequences = [self.complete(task, self.player) for task in self.tasks]
+
+        with self.assertNumQueries(1):
+            results = self.write_behind.flush()
+
+        self.assertEqual(sorted(results), sequences)
+        self.assertEqual(
+            Task.objects.filter(completed=True, completed_by=self.player).count(),
+            len(self.tasks),
+        )
+        self.assertEqual(self.write_behind.pending, {})
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.version, 1)
+        self.assertEqual({task.version for task in results.values()}, {1})
+        self.assertFalse(Task.objects.filter(game=self.game, version=0).exists())
+
+    def test_flush_keeps_earlier_database_completion(self):
+        """Flush does not overwrite, or report, a completion that lost to an
+        earlier one written by another process"""
+        sequence = self.complete(self.tasks[0], self.player)
+        earlier = COMPLETED_AT - timedelta(seconds=1)
+        Task.complete(self.tasks[0].id, self.other_player.id, earlier)
+
+        self.assertEqual(self.write_behind.flush(), {sequence: None})
+
+        task = Task.objects.get(id=self.tasks[0].id)
+        self.assertEqual(task.completed_by, self.other_player)
+        self.assertEqual(task.last_updated, earlier)
+
+    def test_failed_flush_kept_pending(self):
+        """A failed flush settles nothing and the next flush writes its completions"""
+        sequence = self.complete(self.tasks[0], self.player)
+
+        with patch.object(self.write_behind, "write", side_effect=Exception("down")):
+            self.assertEqual(self.write_behind.flush(), {})
+
+        self.assertIn(self.tasks[0].id, self.write_behind.pending)
+        self.assertTrue(self.write_behind.flush()[sequence].completed)
+
+    def test_lines_detected_on_flush(self):
+        """Completed lines are reported from the flushed line counts, each single-cell
+        column included and the row by the last cell on it"""
+        sequences = [self.complete(task, self.player) for task in self.tasks]
+
+        results = self.write_behind.flush()
+
+        self.assertEqual(
+            results[sequences[-1]].lines,
+            [{"line": "row", "index": 0}, {"line": "column", "index": 4}],
+        )
+        self.assertEqual(results[sequences[0]].lines, [{"line": "column", "index": 0}])
+
+    def test_lines_completed_by_another_process(self):
+        """Lines completed together with another process's cells are still reported"""
+        for task in self.tasks[1:]:
+            Task.complete(task.id, self.other_player.id, COMPLETED_AT)
+        sequence = self.complete(self.tasks[0], self.player)
+
+        task = self.write_behind.flush()[sequence]
+
+        self.assertIn({"line": "row", "index": 0}, task.lines)
+
+    def test_flush_marks_cells(self):
+        """Flushed completions mark the game's bitmap and line counts"""
+        for task in self.tasks[:2]:
+            self.complete(task, self.player)
+
+        self.write_behind.flush()
+
+        self.game.refresh_from_db()
+        self.assertEqual(completed_positions(self.game), [(0, 0), (0, 1)])
+        self.assertEqual(self.game.line_counts, [2, 1, 1, 0, 0, 0, 0, 0])
+
+    def test_earlier_completion_replaces_pending(self):
+        """Taking over a pending completion settles the replaced one as lost"""
+        replaced = self.complete(self.tasks[0], self.player)
+        earlier = COMPLETED_AT - timedelta(seconds=1)
+        sequence = self.complete(self.tasks[0], self.other_player, earlier)
+
+        results = self.write_behind.flush()
+
+        self.assertIsNone(results[replaced])
+        self.assertEqual(results[sequence].completed_by.id, self.other_player.id)
+        self.assertIsNone(results[sequence].previous_completed_by_id)
+
+    def test_earlier_completion_records_previous_player(self):
+        """Taking over a written completion reports the player it was taken from"""
+        Task.complete(self.tasks[0].id, self.player.id, COMPLETED_AT)
+        earlier = COMPLETED_AT - timedelta(seconds=1)
+        sequence = self.complete(self.tasks[0], self.other_player, earlier)
+
+        task = self.write_behind.flush()[sequence]
+
+        self.assertEqual(task.previous_completed_by_id, self.player.id)
+        self.assertEqual(task.lines, [])
+
+
+class TaskWriteBehindCommitTest(WriteBehindGame, TransactionTestCase):
+    """commit() flushes through database_sync_to_async, which closes
+    connections left inside a TestCase transaction."""
+
+    async def test_commit(self):
+        """commit() returns the completion once the scheduled flush writes it"""
+        self.write_behind.interval = 0
+        sequence = await database_sync_to_async(self.complete)(
+            self.tasks[0], self.player
+        )
+
+        task = await self.write_behind.commit(sequence)
+
+        self.assertEqual(task.version, 1)
+        self.assertEqual(self.write_behind.waiters, {})
+
+    async def test_commit_retries_failed_flush(self):
+        """A failed flush is retried after the interval without another completion"""
+        self.write_behind.interval = 0
+        write = self.write_behind.write
+        calls = []
+
+        def flaky_write(tasks):
+            calls.append(tasks)
+            if len(calls) == 1:
+                raise Exception("down")
+            return write(tasks)
+
+        sequence = await database_sync_to_async(self.complete)(
+            self.tasks[0], self.player
+        )
+        with patch.object(self.write_behind, "write", side_effect=flaky_write):
+            task = await self.write_behind.commit(sequence)
+
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(task.completed)
@@ -1,9 +1,21 @@
 from django.urls import path
 
-from game.views import CreateAndRetrieveGame, CreatePlayer, RetrieveGame
+from game.views import (
+    CreateAndRetrieveGame,
+    CreatePlayer,
+    RetrieveGame,
+    RetrieveGameChanges,
+    RetrieveLeaderboard,
+)
 
 urlpatterns = [
     path("publish_game/", CreateAndRetrieveGame.as_view(), name="publish_game"),
     path("join_game/", RetrieveGame.as_view(), name="join_game"),
     path("create_player/", CreatePlayer.as_view(), name="create_player"),
+    path("<str:code>/changes/", RetrieveGameChanges.as_view(), name="game_changes"),
+    path(
+        "<str:code>/leaderboard/",
+        RetrieveLeaderboard.as_view(),
+        name="game_leaderboard",
+    ),
 ]
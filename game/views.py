@@ -3,12 +3,17 @@ import logging
 
 import sentry_sdk
 from django.db import transaction
+from django.db.models import Count, Q, Subquery
+from django.db.models.functions import Now
+from django.http import HttpResponse
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from app.routers import pin_primary
+from game import cache
 from game.models import Game, Player, Task
-from game.serializers import GameSerializer, PlayerSerializer
+from game.serializers import BoardSerializer, PlayerSerializer, task_data
 
 logger = logging.getLogger("game")
 
@@ -35,7 +40,7 @@ class CreatePlayer(APIView):
 
 
 class CreateAndRetrieveGame(APIView):
-    serializer_class = GameSerializer
+    serializer_class = BoardSerializer
 
     def post(self, request):
         try:
@@ -45,7 +50,11 @@ class CreateAndRetrieveGame(APIView):
 
             tasks_to_create = []
             with transaction.atomic():
-                created_game = Game.create_with_unique_code(game_title)
+                created_game = Game.create_with_unique_code(
+                    game_title,
+                    grid_rows=len(game_values),
+                    grid_columns=max(map(len, game_values), default=0),
+                )
                 player = Player.objects.get(id=player_id)
                 created_game.players.add(player)
                 for rowIndex, row in enumerate(game_values):
@@ -59,15 +68,11 @@ class CreateAndRetrieveGame(APIView):
                         tasks_to_create.append(task)
                 Task.objects.bulk_create(tasks_to_create)
 
-            game = (
-                Game.objects.filter(id=created_game.id)
-                .prefetch_related("tasks", "players")
-                .order_by("tasks__grid_column")
-                .first()
-            )
-            serializer = self.serializer_class(game)
-            response = Response(
-                {"status": "success", "game": serializer.data}, status=200
+            board = self.serializer_class(created_game).data
+            cache.set_board(board)
+            response = HttpResponse(
+                self.serializer_class.render({"status": "success", "game": board}),
+                content_type="application/json",
             )
         except Exception as e:
             logger.exception("Unexpected Error: ", exc_info=e)
@@ -80,7 +85,7 @@ class CreateAndRetrieveGame(APIView):
 
 
 class RetrieveGame(APIView):
-    serializer_class = GameSerializer
+    serializer_class = BoardSerializer
 
     def post(self, request):
         response = Response(
@@ -90,19 +95,126 @@ class RetrieveGame(APIView):
         try:
             game_code = request.data.get("code")
             player_id = request.data.get("player_id")
-            game = (
-                Game.objects.filter(code=game_code)
-                .prefetch_related("tasks", "players")
-                .order_by("tasks__grid_column")
-                .first()
+            board = cache.get_board(game_code)
+            if board is None:
+                game = Game.objects.filter(code=game_code).first()
+                if game:
+                    board = self.serializer_class(game).data
+                    cache.set_board(board)
+            if board:
+                if not any(str(p["id"]) == str(player_id) for p in board["players"]):
+                    player = Player.objects.get(id=player_id)
+                    Game.players.through.objects.bulk_create(
+                        [Game.players.through(game_id=board["id"], player=player)],
+                        ignore_conflicts=True,
+                    )
+                    Game.objects.filter(id=board["id"]).update(last_active=Now())
+                    player_data = PlayerSerializer(player).data
+                    cache.add_player(board["code"], player_data)
+                    board["players"].append(player_data)
+                response = HttpResponse(
+                    self.serializer_class.render({"status": "success", "game": board}),
+                    content_type="application/json",
+                )
+        except Exception as e:
+            logger.exception("Unexpected Error: ", exc_info=e)
+            sentry_sdk.capture_exception(e)
+            response = Response(
+                {"status": "error", "message": "Unexpected Error"}, status=500
             )
+
+        return response
+
+
+class RetrieveGameChanges(APIView):
+    def get(self, request, code):
+        """Tasks completed or taken over since the client's version watermark"""
+        response = Response(
+            {"status": "error", "message": "Game not found"}, status=404
+        )
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            return Response(
+                {"status": "error", "message": "since must be a game version"},
+                status=400,
+            )
+        try:
+            game = Game.objects.filter(code=code).values("id", "version").first()
             if game:
-                player = Player.objects.get(id=player_id)
-                game.players.add(player)
-                serializer = self.serializer_class(game)
-                response = Response(
-                    {"status": "success", "game": serializer.data}, status=200
+                tasks = (
+                    Task.objects.filter(game_id=game["id"], version__gt=since)
+                    .order_by("version")
+                    .values_list(*BoardSerializer.task_fields)
+                )
+                response = HttpResponse(
+                    BoardSerializer.render(
+                        {
+                            "status": "success",
+                            "version": game["version"],
+                            "tasks": [task_data(*task) for task in tasks],
+                        }
+                    ),
+                    content_type="application/json",
+                )
+        except Exception as e:
+            logger.exception("Unexpected Error: ", exc_info=e)
+            sentry_sdk.capture_exception(e)
+            response = Response(
+                {"status": "error", "message": "Unexpected Error"}, status=500
+            )
+
+        return response
+
+
+class RetrieveLeaderboard(APIView):
+    def get(self, request, code):
+        """Completed task counts per player, served from the cached leaderboard"""
+        response = Response(
+            {"status": "error", "message": "Game not found"}, status=404
+        )
+        try:
+            scores = cache.get_leaderboard(code)
+            if scores is None:
+                # Counted on the primary in one statement, so the version is
+                # exactly the completions the counts include
+                with pin_primary():
+                    players = list(
+                        Player.objects.filter(games__code=code)
+                        .annotate(
+                            completed=Count(
+                                "task",
+                                filter=Q(task__game__code=code, task__completed=True),
+                            ),
+                            version=Subquery(
+                                Game.objects.filter(code=code).values("version")
+                            ),
+                        )
+                        .values_list("id", "name", "completed", "version")
+                    )
+                names = {player_id: name for player_id, name, *_ in players}
+                scores = {
+                    player_id: completed for player_id, _, completed, _ in players
+                }
+                if players:
+                    cache.set_leaderboard(code, scores, players[0][3])
+            else:
+                names = dict(
+                    Player.objects.filter(id__in=scores).values_list("id", "name")
+                )
+            if names:
+                leaderboard = sorted(
+                    (
+                        {
+                            "id": player_id,
+                            "name": names.get(player_id),
+                            "completed": completed,
+                        }
+                        for player_id, completed in scores.items()
+                    ),
+                    key=lambda player: (-player["completed"], player["id"]),
                 )
+                response = Response({"status": "success", "leaderboard": leaderboard})
         except Exception as e:
             logger.exception("Unexpected Error: ", exc_info=e)
             sentry_sdk.capture_exception(e)
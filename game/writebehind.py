@@ -0,0 +1,251 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+import sentry_sdk
+from channels.db import database_sync_to_async
+from django.db import router
+
+from game.models import MARK_CELLS_SQL, Game, Player, Task
+
+logger = logging.getLogger("game")
+
+
+class TaskWriteBehind:
+    """Queues task completions against in-memory boards and batches the database writes.
+
+    Boards are loaded once per game and held until the next flush, so queueing
+    a completion costs no database round trip. Pending completions are written
+    with one conditional statement per flush, which applies the same
+    earliest-completion-wins rule, version bump and cell marking as
+    Task.complete. Boards only filter out completions that have already lost;
+    the flush decides which completions won, so their versions, previous
+    players and completed lines come from the committed rows and hold up when
+    several processes write to the same game. Nothing about a completion is
+    published until commit() returns it.
+    """
+
+    def __init__(self, enabled=False, interval_ms=200, batch_size=100):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.boards = {}
+        self.pending = {}
+        self.superseded = []
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.flush_handle = None
+        self.waiters = {}
+        self.results = {}
+
+    def complete(self, game_id, task_id, player_id, last_updated):
+        """Queues a completion for the next flush.
+
+        Returns its sequence number for commit(), or None if the completion
+        already lost to one on the board.
+        """
+        with self.lock:
+            board = self.boards.get(int(game_id))
+            if board is None:
+                board = self.boards[int(game_id)] = self.load_board(game_id)
+
+            task = board["tasks"].get(int(task_id))
+            if not task or (task.completed and last_updated >= task.last_updated):
+                return None
+
+            player = board["players"].get(int(player_id))
+            if player is None:
+                player = Player.objects.get(id=player_id)
+                board["players"][player.id] = player
+            task.completed = True
+            task.completed_by = player
+            task.last_updated = last_updated
+            if task.id in self.pending:
+                self.superseded.append(self.pending[task.id][0])
+            self.sequence += 1
+            self.pending[task.id] = (self.sequence, task)
+            return self.sequence
+
+    def load_board(self, game_id):
+        game = (
+            Game.objects.db_manager(router.db_for_write(Game))
+            .prefetch_related("players")
+            .get(id=game_id)
+        )
+        tasks = game.tasks.select_related("completed_by")
+        for task in tasks:
+            task.game = game
+        return {
+            "tasks": {task.id: task for task in tasks},
+            "players": {player.id: player for player in game.players.all()},
+        }
+
+    def flush(self):
+        """Write all pending completions to the database and drop loaded boards.
+
+        Returns {sequence: Task or None} for every completion settled by the
+        flush, None for those that lost to an earlier completion in the
+        database or were replaced by an earlier one before the flush. A failed
+        flush settles nothing and keeps its completions pending.
+        """
+        with self.lock:
+            pending = sorted(self.pending.values(), key=lambda entry: entry[0])
+            results = dict.fromkeys(self.superseded)
+            if pending:
+                try:
+                    written = self.write([task for _, task in pending])
+                except Exception as e:
+                    logger.exception("Failed write-behind task flush", exc_info=e)
+                    sentry_sdk.capture_exception(e)
+                    return {}
+                for sequence, task in pending:
+                    results[sequence] = written.get(task.id)
+                self.mark_lines(
+                    [written[task.id] for _, task in pending if task.id in written]
+                )
+            self.pending = {}
+            self.superseded = []
+            self.boards = {}
+            return results
+
+    def mark_lines(self, tasks):
+        """Sets lines on written tasks, in sequence order, from the flushed line counts.
+
+        A line completed by the flush goes to the last cell on it that the
+        flush marked, so a line completed by several cells in one batch is
+        reported once.
+        """
+        claimed = set()
+        for task in reversed(tasks):
+            task.lines = []
+            if task.was_completed:
+                continue
+            task.previous_completed_by_id = None
+            for line in task.game.completed_lines(task.grid_row, task.grid_column):
+                if (task.game_id, line["line"], line["index"]) not in claimed:
+                    claimed.add((task.game_id, line["line"], line["index"]))
+                    task.lines.append(line)
+
+    def write(self, tasks):
+        """Returns the written Tasks by id, populated as by Task.complete"""
+        values = ", ".join(["(%s::bigint, %s::bigint, %s::timestamptz)"] * len(tasks))
+        params = []
+        for task in sorted(tasks, key=lambda task: task.id):
+            params += [task.id, task.completed_by.id, task.last_updated]
+        task_table = Task._meta.db_table
+        player_table = Player._meta.db_table
+        game_table = Game._meta.db_table
+        written = list(
+            Task.objects.db_manager(router.db_for_write(Task)).raw(
+                f"""
+            WITH pending (id, player_id, last_updated) AS (VALUES {values}),
+            won AS (
+                SELECT {task_table}.id, {task_table}.game_id,
+                    {task_table}.grid_row, {task_table}.grid_column,
+                    {task_table}.completed AS was_completed,
+                    {task_table}.completed_by_id AS previous_completed_by_id,
+                    pending.player_id, pending.last_updated
+                FROM {task_table} JOIN pending ON pending.id = {task_table}.id
+                WHERE NOT {task_table}.completed
+                OR {task_table}.last_updated > pending.last_updated
+                ORDER BY {task_table}.id
+                FOR UPDATE OF {task_table}
+            ), marked AS (
+                SELECT game_id, grid_row, grid_column
+                FROM won WHERE NOT was_completed
+            ), bumped AS (
+                UPDATE {game_table} AS g
+                SET version = g.version + 1, last_active = now(),
+                    {MARK_CELLS_SQL}
+                WHERE g.id IN (SELECT game_id FROM won)
+                RETURNING g.id, g.code, g.version,
+                    g.grid_rows, g.grid_columns, g.line_counts
+            ), updated AS (
+                UPDATE {task_table}
+                SET completed = true,
+                    completed_by_id = won.player_id,
+                    last_updated = won.last_updated,
+                    version = bumped.version
+                FROM won JOIN bumped ON bumped.id = won.game_id
+                WHERE {task_table}.id = won.id
+                RETURNING {task_table}.*,
+                    won.was_completed, won.previous_completed_by_id
+            )
+            SELECT updated.*,
+                {player_table}.name AS completed_by_name,
+                bumped.code AS game_code,
+                bumped.grid_rows AS game_grid_rows,
+                bumped.grid_columns AS game_grid_columns,
+                bumped.line_counts AS game_line_counts
+            FROM updated
+            JOIN bumped ON bumped.id = updated.game_id
+            LEFT JOIN {player_table} ON {player_table}.id = updated.completed_by_id
+            """,
+                params,
+            )
+        )
+        games = {}
+        for task in written:
+            task.completed_by = Player(
+                id=task.completed_by_id, name=task.completed_by_name
+            )
+            if task.game_id not in games:
+                games[task.game_id] = Game(
+                    id=task.game_id,
+                    code=task.game_code,
+                    grid_rows=task.game_grid_rows,
+                    grid_columns=task.game_grid_columns,
+                    line_counts=task.game_line_counts,
+                )
+            task.game = games[task.game_id]
+        return {task.id: task for task in written}
+
+    async def commit(self, sequence):
+        """Wait for the flush that settles a queued completion.
+
+        Returns the written Task, or None if the completion lost.
+        """
+        if sequence in self.results:
+            return self.results.pop(sequence)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[sequence] = waiter
+        await self.schedule_flush()
+        return await waiter
+
+    async def schedule_flush(self):
+        """Flush now if the batch is full, otherwise after the flush interval"""
+        if len(self.pending) >= self.batch_size:
+            await self.settle()
+        elif self.flush_handle is None or self.flush_handle.done():
+            self.flush_handle = asyncio.create_task(self.flush_after_interval())
+
+    async def flush_after_interval(self):
+        """Flush every interval until nothing is left pending, so a failed flush
+        is retried without waiting for another completion"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.settle()
+            if not self.pending:
+                return
+
+    async def settle(self):
+        """Flush and hand each settled completion to the commit() waiting on it"""
+        results = await database_sync_to_async(self.flush)()
+        self.results = {}
+        for sequence, task in results.items():
+            waiter = self.waiters.pop(sequence, None)
+            if waiter is None:
+                # Queued just before the flush, its commit() hasn't started waiting
+                self.results[sequence] = task
+            elif not waiter.done():
+                waiter.set_result(task)
+
+
+write_behind = TaskWriteBehind(
+    enabled=os.getenv("TASK_WRITE_BEHIND", "false").lower() == "true",
+    interval_ms=int(os.getenv("TASK_WRITE_BEHIND_INTERVAL_MS", 200)),
+    batch_size=int(os.getenv("TASK_WRITE_BEHIND_BATCH_SIZE", 100)),
+)
+atexit.register(write_behind.flush)